@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import resource
+import tempfile
+import time
+
+import httpx
+
+import main
+from provider_stubs import start_stub_server
+from selfcheck import fixture_providers
+
+# Offline benchmark: points every provider (and TapTap) at the local stubs in
+# provider_stubs.py, runs full refresh cycles through the production scheduler
+# (refresh()), then hammers the read endpoints in-process. No network access needed:
+#
+#   python bench.py --latency 0.2 --failure-rate 0.05 --cycles 2
+#
+# Reports cycle wall time, per-scrape latency percentiles, peak RSS (this
+# process plus browser children), browser launches and read-endpoint RPS.
+
+STUB_PROVIDERS = ("MG", "WU", "LEMFI", "MET", "TAPTAP")
+READ_PATHS = [
+    "/moneygram?from_currency=CAD&to_currency=TND",
+    "/wu?from_currency=USD&to_currency=MXN",
+    "/lemfi?from_currency=EUR&to_currency=INR",
+    "/myeasytransfer?from_currency=EUR&to_currency=TND",
+    "/rates?pairs=USD-MXN,CAD-TND",
+    "/rates?pairs=EUR-INR&providers=MG,WU",
+    "/compare?from_currency=USD&to_currency=MXN",
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def process_tree_rss() -> int:
+    # Resident bytes of this process and all its descendants (Chromium runs
+    # as children, so getrusage(RUSAGE_SELF) alone would miss most of it)
+    children = {}
+    rss = {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{pid}/statm") as f:
+                rss[int(pid)] = int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(pid))
+
+    total = 0
+    stack = [os.getpid()]
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack.extend(children.get(pid, ()))
+    return total
+
+
+async def sample_rss(peak: dict, interval: float = 0.2):
+    while True:
+        peak["rss"] = max(peak["rss"], process_tree_rss())
+        await asyncio.sleep(interval)
+
+
+def timed_fetch_rate(samples: list[tuple[str, float, bool]]):
+    fetch_rate = main.fetch_rate
+
+    async def fetch(provider_key: str, from_currency: str, to_currency: str):
+        started = time.monotonic()
+        rate = None
+        try:
+            rate = await fetch_rate(provider_key, from_currency, to_currency)
+            return rate
+        finally:
+            samples.append((provider_key, time.monotonic() - started, rate is not None))
+
+    return fetch
+
+
+def cycles_observed() -> tuple[int, float]:
+    # (count, total seconds) of scheduler batches recorded by fx_refresh_cycle_seconds
+    series = main.cycle_duration.values.get(())
+    return (sum(series[0]), series[1]) if series else (0, 0.0)
+
+
+async def run_cycle() -> float:
+    # Intervals are zeroed and the tick is huge, so a fresh scheduler dispatches
+    # every job in its first tick and then sleeps until it is cancelled
+    count, total = cycles_observed()
+    scheduler = asyncio.create_task(main.refresh())
+    try:
+        while cycles_observed()[0] == count:
+            await asyncio.sleep(0.05)
+    finally:
+        scheduler.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await scheduler
+    return cycles_observed()[1] - total
+
+
+async def bench_reads(requests: int, concurrency: int) -> tuple[float, float, int]:
+    transport = httpx.ASGITransport(app=main.app)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker(offset: int):
+            nonlocal errors
+            for i in range(offset, requests, concurrency):
+                started = time.perf_counter()
+                response = await client.get(READ_PATHS[i % len(READ_PATHS)])
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return requests / elapsed, percentile(latencies, 99) * 1000, errors
+
+
+async def run(args) -> dict:
+    latency = {key: args.latency for key in STUB_PROVIDERS}
+    failure_rate = {key: args.failure_rate for key in STUB_PROVIDERS}
+    server = start_stub_server(latency=latency, failure_rate=failure_rate)
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    # Swap the registry in place: every scrape path looks PROVIDERS up at call time
+    pairs = {key: list(provider.pairs) for key, provider in main.PROVIDERS.items()}
+    main.PROVIDERS.update(fixture_providers(base, pairs))
+    main.TAPTAP_URL = f"{base}/api/fxRates"
+    # Keep history appends away from the real store
+    main.HISTORY_DIR = tempfile.mkdtemp(prefix="fx-bench-history-")
+    main.REFRESH_MIN_INTERVAL = main.REFRESH_MAX_INTERVAL = 0
+    main.SCHEDULER_TICK = 10**9
+
+    samples = []
+    main.fetch_rate = timed_fetch_rate(samples)
+    peak = {"rss": 0}
+    sampler = asyncio.create_task(sample_rss(peak))
+
+    cycles = []
+    try:
+        await main.browser_pool.start()
+        for _ in range(args.cycles):
+            cycles.append(await run_cycle())
+        rps, read_p99_ms, read_errors = await bench_reads(args.requests, args.concurrency)
+    finally:
+        sampler.cancel()
+        await main.close_http_client()
+        await main.browser_pool.close()
+        server.shutdown()
+
+    peak["rss"] = max(peak["rss"], resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+    scrape_latencies = [elapsed for _, elapsed, _ in samples]
+    per_provider = {}
+    for key in pairs:
+        provider_samples = [s for s in samples if s[0] == key]
+        per_provider[key] = {
+            "scrapes": len(provider_samples),
+            "failures": sum(1 for s in provider_samples if not s[2]),
+            "p50_s": round(percentile([s[1] for s in provider_samples], 50), 3),
+            "p95_s": round(percentile([s[1] for s in provider_samples], 95), 3),
+        }
+
+    return {
+        "latency_s": args.latency,
+        "failure_rate": args.failure_rate,
+        "cycles_s": [round(c, 2) for c in cycles],
+        "scrapes": len(samples),
+        "scrape_failures": sum(1 for s in samples if not s[2]),
+        "scrape_p50_s": round(percentile(scrape_latencies, 50), 3),
+        "scrape_p95_s": round(percentile(scrape_latencies, 95), 3),
+        "scrape_p99_s": round(percentile(scrape_latencies, 99), 3),
+        "per_provider": per_provider,
+        "stub_requests": dict(server.requests),
+        "peak_rss_mb": round(peak["rss"] / 1e6, 1),
+        "browser_launches": main.browser_pool.launches,
+        "read_rps": round(rps),
+        "read_p99_ms": round(read_p99_ms, 2),
+        "read_errors": read_errors,
+    }
+
+
+def print_report(result: dict):
+    print(f"cycles:           {', '.join(f'{c:.2f}s' for c in result['cycles_s'])}")
+    print(
+        f"scrapes:          {result['scrapes']} ({result['scrape_failures']} failed), "
+        f"p50 {result['scrape_p50_s']:.3f}s p95 {result['scrape_p95_s']:.3f}s "
+        f"p99 {result['scrape_p99_s']:.3f}s"
+    )
+    for key, stats in result["per_provider"].items():
+        print(
+            f"  {key:<6} {stats['scrapes']:>3} scrapes, {stats['failures']} failed, "
+            f"p50 {stats['p50_s']:.3f}s p95 {stats['p95_s']:.3f}s"
+        )
+    print(f"peak RSS:         {result['peak_rss_mb']:.1f} MB (incl. browsers)")
+    print(f"browser launches: {result['browser_launches']}")
+    print(
+        f"read endpoints:   {result['read_rps']} req/s, p99 {result['read_p99_ms']:.2f} ms, "
+        f"{result['read_errors']} errors"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline refresh/read benchmark")
+    parser.add_argument("--latency", type=float, default=0.1, help="stub latency per request (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="stub failure probability")
+    parser.add_argument("--cycles", type=int, default=1, help="full refresh cycles to run")
+    parser.add_argument("--requests", type=int, default=5000, help="read requests to send")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent readers")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
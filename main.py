@@ -1,15 +1,25 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from playwright.async_api import async_playwright
-import re, json, time, os
+from fastapi.responses import StreamingResponse
+import re, json, time, os, sys
 import asyncio
+import heapq
+import math
+import contextlib
+import contextvars
+import importlib
+import fcntl
+import mmap
+import socket
+import sqlite3
+import struct
+import threading
 import logging
-import urllib.request
-import json
-import webbrowser
-import requests 
-from jsonpath_ng.ext import parse
-from jsonpath_ng import parse
+from collections import deque
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+import httpx
 from urllib.parse import urlencode
 
 logging.basicConfig(
@@ -31,7 +41,7 @@ TEMP_CACHE_FILE = "tmp_fx_rates.json"
 SESSION_FILE = "moneygram_session.json"
 
 # -- TapTap config ---
-TAPTAP_URL = "https://api.taptapsend.com/api/fxRates"
+TAPTAP_URL = os.getenv("TAPTAP_URL", "https://api.taptapsend.com/api/fxRates")
 TAPTAP_HEADERS = {
     "appian-version": "web/2022-05-03.0",
     "x-device-id": "web",
@@ -39,39 +49,6 @@ TAPTAP_HEADERS = {
 }
 
 
-def extract_rate(data, source, target):
-    try:
-        countries = data.get("availableCountries", [])
-        for country in countries:
-            if country.get("currency") == source:
-                for corridor in country.get("corridors", []):
-                    if corridor.get("currency") == target:
-                        return float(corridor.get("fxRate"))
-        return None
-    except Exception as e:
-        print("extract_rate error:", e)
-        return None
-
-
-
-
-@app.get("/taptap")
-def get_taptap_rate(
-    from_currency: str = Query(..., alias="from"),
-    to_currency: str = Query(..., alias="to"),
-):
-    try:
-        response = requests.get(TAPTAP_URL, headers=TAPTAP_HEADERS, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        logging.info(data)
-        rate = extract_rate(data, from_currency, to_currency)
-
-        return {"provider": "TapTap Send", "rate": rate}
-
-    except Exception as e:
-        return {"provider": "TapTap Send", "rate": None, "error": str(e)}
-
 # --- Lemfi config ---
 LEMFI_CONFIG = {
     ("CAD", "TND"): {
@@ -310,249 +287,2421 @@ TARGET_ENDPOINT = "https://www.westernunion.com/router/"
 US_TARGET_ENDPOINT = "https://www.westernunion.com/wuconnect/prices/catalog"
 
 
-# --- MyEasyTransfer scraper ---
-async def fetch_myeasytransfer_rate(
-    from_currency: str, to_currency: str
-) -> float | None:
-    params = MYEASYTRANSFER_CONFIG.get((from_currency, to_currency))
-    if not params:
-        logging.error(f"[EASYTR ERROR] Unsupported pair {from_currency}->{to_currency}")
-        return None
+# --- Metrics and tracing ---
+# Prometheus text exposition, hand-rolled: a few counters and histograms
+# don't justify a client library. Each process records its own values (scrape
+# metrics in the leader and queue workers, read latency in every worker);
+# /metrics merges them from METRICS_DIR with a worker="<pid>" label.
+SCRAPE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 20, 30, 60)
+CYCLE_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600)
+READ_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+# Emit one JSON "[TRACE]" log line per scrape with its timed spans
+TRACE_SPANS = os.getenv("TRACE_SPANS", "0") == "1"
+
+
+def format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self, workers: dict[str, dict]) -> list[str]:
+        # workers: pid -> this counter's values in that process
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        names = ("worker", *self.labels)
+        for worker, values in sorted(workers.items()):
+            for label_values, value in sorted(values.items()):
+                lines.append(f"{self.name}{format_labels(names, (worker, *label_values))} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], buckets: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        series[1] += value
+
+    def render(self, workers: dict[str, dict]) -> list[str]:
+        # workers: pid -> this histogram's values in that process
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = ("worker", *self.labels)
+        for worker, values in sorted(workers.items()):
+            for label_values, (counts, total) in sorted(values.items()):
+                label_values = (worker, *label_values)
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += count
+                    labels = format_labels(names, label_values, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(names, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
 
-    query = urlencode(params)
-    url = f"https://www.api.myeasytransfer.com/v1/fxrates/fxrate?{query}"
-    logging.debug(f"[EASYTR] url: {url}")
+
+scrape_duration = Histogram(
+    "fx_scrape_duration_seconds", "Time to fetch one provider pair", ("provider",), SCRAPE_BUCKETS
+)
+scrape_results = Counter(
+    "fx_scrapes_total", "Scrapes by outcome", ("provider", "result")
+)
+browser_launch_duration = Histogram(
+    "fx_browser_launch_seconds", "Chromium launch time", ("headless",), SCRAPE_BUCKETS
+)
+page_navigate_duration = Histogram(
+    "fx_page_navigate_seconds", "page.goto until commit", ("provider",), SCRAPE_BUCKETS
+)
+page_ready_duration = Histogram(
+    "fx_page_ready_seconds", "Request start until the rate data arrived", ("provider",), SCRAPE_BUCKETS
+)
+cycle_duration = Histogram(
+    "fx_refresh_cycle_seconds", "Wall time of a batch of dispatched refresh jobs", (), CYCLE_BUCKETS
+)
+read_duration = Histogram(
+    "fx_read_duration_seconds", "Read endpoint latency", ("endpoint",), READ_BUCKETS
+)
+browser_launches = Counter("fx_browser_launches_total", "Chromium processes launched")
+blocked_requests = Counter(
+    "fx_blocked_requests_total", "Subresource requests aborted by block policies", ("provider",)
+)
+blocked_bytes = Counter(
+    "fx_blocked_bytes_estimated_total",
+    "Estimated bytes not downloaded thanks to block policies",
+    ("provider",),
+)
+METRICS = [
+    scrape_duration,
+    scrape_results,
+    browser_launch_duration,
+    page_navigate_duration,
+    page_ready_duration,
+    cycle_duration,
+    read_duration,
+    browser_launches,
+    blocked_requests,
+    blocked_bytes,
+]
+
+# Spans of the scrape running in the current task, None when not tracing
+current_trace: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+@contextlib.contextmanager
+def span(name: str):
+    spans = current_trace.get()
+    if spans is None:
+        yield
+        return
+    started = time.monotonic()
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(
-                headless=False, args=["--disable-blink-features=AutomationControlled"]
+        yield
+    finally:
+        spans.append({"name": name, "ms": round((time.monotonic() - started) * 1000, 1)})
+
+
+def add_span(name: str, seconds: float):
+    # For phases timed elsewhere (e.g. readiness measured from request start)
+    spans = current_trace.get()
+    if spans is not None:
+        spans.append({"name": name, "ms": round(seconds * 1000, 1)})
+
+
+# --- Browser pool ---
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", "50"))
+BROWSER_HEALTH_CHECK_INTERVAL = int(os.getenv("BROWSER_HEALTH_CHECK_INTERVAL", "60"))
+BROWSER_ARGS = ["--disable-blink-features=AutomationControlled"]
+# Apply playwright-stealth evasions to every leased context
+BROWSER_STEALTH = os.getenv("BROWSER_STEALTH", "1") == "1"
+
+
+def headless_for(provider: str) -> bool:
+    # BROWSER_HEADLESS sets the default, <PROVIDER>_HEADLESS overrides it
+    default = os.getenv("BROWSER_HEADLESS", "1")
+    return os.getenv(f"{provider}_HEADLESS", default) == "1"
+
+
+def timeout_errors() -> tuple:
+    # Playwright is imported lazily, so its TimeoutError only exists once the pool started
+    async_api = sys.modules.get("playwright.async_api")
+    if async_api is None:
+        return (asyncio.TimeoutError,)
+    return (asyncio.TimeoutError, async_api.TimeoutError)
+
+
+class PooledBrowser:
+    def __init__(self, browser, headless: bool):
+        self.browser = browser
+        self.headless = headless
+        self.uses = 0
+        self.active = 0
+        self.retired = False
+
+
+# Long-lived Chromium processes shared by all scrapers. Each scrape leases a
+# fresh BrowserContext; a browser is retired after `max_uses` leases, on crash
+# or on a failed health check, and replaced on the next lease.
+class BrowserPool:
+    def __init__(self, size: int, max_uses: int):
+        self.size = size
+        self.max_uses = max_uses
+        self.launches = 0
+        self._playwright = None
+        self._stealth = None
+        self._slots: dict[bool, list[PooledBrowser]] = {True: [], False: []}
+        self._lock = asyncio.Lock()
+        self._health_task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._playwright is None:
+            # Imported on first use and off the event loop, so workers that only
+            # serve reads never load Playwright and serving never blocks on it
+            async_api = await asyncio.to_thread(importlib.import_module, "playwright.async_api")
+            if BROWSER_STEALTH and self._stealth is None:
+                stealth = await asyncio.to_thread(importlib.import_module, "playwright_stealth")
+                self._stealth = stealth.Stealth()
+            self._playwright = await async_api.async_playwright().start()
+            self._health_task = asyncio.create_task(self._health_loop())
+            logging.info(f"[POOL] started (size={self.size}, max_uses={self.max_uses})")
+
+    async def _launch(self, headless: bool) -> PooledBrowser:
+        started = time.monotonic()
+        with span("browser_launch"):
+            browser = await self._playwright.chromium.launch(
+                headless=headless, args=BROWSER_ARGS
             )
-            page = await browser.new_page()
-            await page.goto(url, wait_until="domcontentloaded", timeout=30000)
-            await page.wait_for_timeout(2000)
-
-            raw_text = await page.inner_text("pre")
-            data = json.loads(raw_text)
-            logging.info(
-                f"[MyEasyTransfer RAW TEXT] {from_currency}->{to_currency}: {raw_text}"
+        browser_launch_duration.observe(time.monotonic() - started, str(headless).lower())
+        self.launches += 1
+        browser_launches.inc()
+        logging.info(f"[POOL] launched browser #{self.launches} (headless={headless})")
+        return PooledBrowser(browser, headless)
+
+    def _retire(self, slot: PooledBrowser):
+        slot.retired = True
+        slots = self._slots[slot.headless]
+        if slot in slots:
+            slots.remove(slot)
+
+    async def _close(self, slot: PooledBrowser):
+        try:
+            await slot.browser.close()
+        except Exception as e:
+            logging.warning(f"[POOL] error closing browser: {e}")
+
+    async def _acquire(self, headless: bool) -> PooledBrowser:
+        async with self._lock:
+            await self.start()
+            slots = self._slots[headless]
+            for slot in list(slots):
+                if not slot.browser.is_connected():
+                    logging.warning("[POOL] browser disconnected, replacing")
+                    self._retire(slot)
+            if len(slots) < self.size:
+                slot = await self._launch(headless)
+                slots.append(slot)
+            else:
+                slot = min(slots, key=lambda s: s.active)
+            slot.uses += 1
+            slot.active += 1
+            if slot.uses >= self.max_uses:
+                self._retire(slot)
+            return slot
+
+    async def _release(self, slot: PooledBrowser):
+        slot.active -= 1
+        if slot.retired and slot.active == 0:
+            await self._close(slot)
+
+    @contextlib.asynccontextmanager
+    async def lease(self, headless: bool = True, **context_options):
+        with span("browser_acquire"):
+            slot = await self._acquire(headless)
+        context = None
+        try:
+            if headless and "user_agent" not in context_options:
+                # Headless Chromium advertises itself as "HeadlessChrome"
+                context_options["user_agent"] = (
+                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                    f"(KHTML, like Gecko) Chrome/{slot.browser.version} Safari/537.36"
+                )
+            with span("new_context"):
+                context = await slot.browser.new_context(**context_options)
+                if BROWSER_STEALTH:
+                    await self._stealth.apply_stealth_async(context)
+            yield context
+        except Exception:
+            if not slot.browser.is_connected():
+                logging.warning("[POOL] browser crashed during scrape, recycling")
+                self._retire(slot)
+            raise
+        finally:
+            if context is not None:
+                with contextlib.suppress(Exception):
+                    await context.close()
+            await self._release(slot)
+
+    async def _check(self, slot: PooledBrowser) -> bool:
+        if not slot.browser.is_connected():
+            return False
+        try:
+            context = await asyncio.wait_for(slot.browser.new_context(), timeout=10)
+            await context.close()
+            return True
+        except Exception:
+            return False
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(BROWSER_HEALTH_CHECK_INTERVAL)
+            for slots in self._slots.values():
+                for slot in list(slots):
+                    if not await self._check(slot):
+                        logging.warning("[POOL] health check failed, recycling browser")
+                        self._retire(slot)
+                        if slot.active == 0:
+                            await self._close(slot)
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        async with self._lock:
+            for slots in self._slots.values():
+                for slot in list(slots):
+                    self._retire(slot)
+                    await self._close(slot)
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+        logging.info("[POOL] closed")
+
+
+browser_pool = BrowserPool(BROWSER_POOL_SIZE, BROWSER_MAX_USES)
+
+
+# --- Request blocking ---
+# Resources WU and Lemfi pages don't need for extraction. WU only needs the
+# /router/ or /wuconnect/prices/catalog XHR and Lemfi one rate span, so the
+# scripts that produce those stay allowed; everything else heavy is aborted.
+TRACKER_PATTERN = re.compile(
+    r"google-analytics|googletagmanager|doubleclick|googlesyndication|facebook|"
+    r"hotjar|optimizely|adobedtm|demdex|omtrdc|quantummetric|qualtrics|"
+    r"newrelic|nr-data|tiktok|bat\.bing|clarity\.ms|segment\.(io|com)|intercom"
+)
+BLOCK_POLICIES = {
+    "WU": {
+        "resource_types": {"image", "media", "font", "stylesheet"},
+        "url_pattern": TRACKER_PATTERN,
+    },
+    "LEMFI": {
+        "resource_types": {"image", "media", "font", "stylesheet"},
+        "url_pattern": TRACKER_PATTERN,
+    },
+}
+# Blocked requests never download, so bytes saved are estimated per type
+ESTIMATED_RESOURCE_BYTES = {
+    "image": 40_000,
+    "media": 500_000,
+    "font": 35_000,
+    "stylesheet": 25_000,
+    "script": 60_000,
+}
+DEFAULT_RESOURCE_BYTES = 10_000
+
+
+async def apply_block_policy(page, provider: str):
+    policy = BLOCK_POLICIES[provider]
+
+    async def handle_route(route):
+        request = route.request
+        if request.resource_type in policy["resource_types"] or policy[
+            "url_pattern"
+        ].search(request.url):
+            blocked_requests.inc(provider)
+            blocked_bytes.inc(
+                provider,
+                amount=ESTIMATED_RESOURCE_BYTES.get(request.resource_type, DEFAULT_RESOURCE_BYTES),
             )
-            fx_rate_bank = data["fxRate"]["fxRateBank"]
-            await browser.close()
-            return fx_rate_bank
-    except Exception as e:
-        logging.error(f"[MyEasyTransfer EXCEPTION] {from_currency}->{to_currency}: {e}")
-        return None
+            await route.abort()
+        else:
+            await route.continue_()
 
+    await page.route("**/*", handle_route)
 
-# --- MoneyGram scraper ---
-async def fetch_moneygram_rate(from_currency: str, to_currency: str) -> float | None:
-    # Look up parameters from config
-    params = MONEYGRAM_CONFIG.get((from_currency, to_currency))
-    if not params:
-        raise ValueError(f"No config found for {from_currency}->{to_currency}")
-        return None
 
-    # Build query string dynamically
-    query = urlencode(params)
-    url = f"https://www.moneygram.com/api/send-money/fee-quote/v2?{query}"
+def log_blocked_traffic():
+    for provider in BLOCK_POLICIES:
+        logging.info(
+            f"[{provider} BLOCKED] {blocked_requests.values.get((provider,), 0):.0f} requests, "
+            f"~{blocked_bytes.values.get((provider,), 0) / 1e6:.1f} MB saved so far"
+        )
+
+
+# --- Page readiness ---
+# Per-provider deadline (seconds) for the data signal to arrive
+PROVIDER_DEADLINES = {"MG": 15, "WU": 30, "LEMFI": 30, "MET": 15}
+
+
+def remaining_ms(provider: str, started: float) -> float:
+    left = PROVIDER_DEADLINES[provider] - (time.monotonic() - started)
+    # Playwright treats a timeout of 0 as "no timeout", so never go below 1 ms
+    return max(left * 1000, 1)
+
+
+async def navigate(page, provider: str, url: str, started: float):
+    # Only waits for the response to commit; callers then wait for their data signal
+    navigate_started = time.monotonic()
+    await page.goto(url, wait_until="commit", timeout=remaining_ms(provider, started))
+    elapsed = time.monotonic() - navigate_started
+    page_navigate_duration.observe(elapsed, provider)
+    add_span("navigate", elapsed)
+
+
+def record_wait(provider: str, from_currency: str, to_currency: str, started: float):
+    waited = time.monotonic() - started
+    page_ready_duration.observe(waited, provider)
+    add_span("ready", waited)
+    logging.info(f"[{provider} READY] {from_currency}->{to_currency} in {waited:.2f}s")
+
+
+# --- Direct HTTP client ---
+# JSON providers are fetched over a shared keep-alive client first and only
+# go through Chromium when the provider answers with a bot challenge.
+HTTP_FAST_PATH = os.getenv("HTTP_FAST_PATH", "1") == "1"
+MONEYGRAM_API_URL = os.getenv(
+    "MONEYGRAM_API_URL", "https://www.moneygram.com/api/send-money/fee-quote/v2"
+)
+MYEASYTRANSFER_API_URL = os.getenv(
+    "MYEASYTRANSFER_API_URL", "https://www.api.myeasytransfer.com/v1/fxrates/fxrate"
+)
+HTTP_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+    ),
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+BOT_CHALLENGE_STATUSES = {403, 429, 503}
+
+
+class BotChallenge(Exception):
+    pass
+
+
+http_client: httpx.AsyncClient | None = None
+session_cookies_mtime: float | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            headers=HTTP_HEADERS,
+            timeout=15,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return http_client
+
+
+def load_session_cookies(client: httpx.AsyncClient):
+    # Reuse cookies saved by the Playwright MoneyGram session, when it changes
+    global session_cookies_mtime
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(
-                headless=False, args=["--disable-blink-features=AutomationControlled"]
+        mtime = os.stat(SESSION_FILE).st_mtime
+    except FileNotFoundError:
+        return
+    if mtime == session_cookies_mtime:
+        return
+    with open(SESSION_FILE, "r") as f:
+        state = json.load(f)
+    for cookie in state.get("cookies", []):
+        client.cookies.set(
+            cookie["name"],
+            cookie["value"],
+            domain=cookie.get("domain", ""),
+            path=cookie.get("path", "/"),
+        )
+    session_cookies_mtime = mtime
+
+
+async def fetch_json(url: str, params: dict) -> dict:
+    client = get_http_client()
+    load_session_cookies(client)
+    response = await client.get(url, params=params)
+    content_type = response.headers.get("content-type", "")
+    if response.status_code in BOT_CHALLENGE_STATUSES or "json" not in content_type:
+        raise BotChallenge(f"HTTP {response.status_code} ({content_type or 'no type'})")
+    response.raise_for_status()
+    return response.json()
+
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+
+# --- Provider registry ---
+# Every (provider, pair) declares how it is fetched ("json", "intercept" or
+# "selector"), which URLs it reads and how the rate is extracted. Extractors
+# are compiled once here and shared by every scrape.
+class JsonPathExtractor:
+    # Compiled on first use: importing jsonpath_ng and building its parser for
+    # every registry entry would otherwise sit on the startup path
+    def __init__(self, path: str, cast=None):
+        self.path = path
+        self.cast = cast
+        self._expr = None
+
+    def __call__(self, data):
+        if self._expr is None:
+            from jsonpath_ng import parse
+
+            self._expr = parse(self.path)
+        matches = [m.value for m in self._expr.find(data)]
+        if not matches:
+            return None
+        return self.cast(matches[0]) if self.cast else matches[0]
+
+
+class RegexExtractor:
+    def __init__(self, pattern: str, group: int = 1):
+        self.pattern = re.compile(pattern)
+        self.group = group
+
+    def __call__(self, text: str):
+        match = self.pattern.search(text)
+        return match.group(self.group) if match else None
+
+
+def url_startswith(prefix: str):
+    return lambda url: url.startswith(prefix)
+
+
+def url_contains(fragment: str):
+    return lambda url: fragment in url
+
+
+@dataclass(frozen=True)
+class PairSpec:
+    method: str
+    url: str
+    params: dict | None = None
+    # "json": extractor applied to the JSON body
+    # "selector": extractor applied to the text of `selector`
+    extractor: object = None
+    selector: str | None = None
+    # "intercept": first (url predicate, extractor) matching a response wins
+    intercepts: tuple = ()
+
+
+@dataclass(frozen=True)
+class Provider:
+    key: str
+    name: str
+    route: str
+    headless: bool
+    pairs: Mapping[tuple[str, str], PairSpec]
+    session_file: str | None = None
+
+
+def wu_rate(value) -> float:
+    return round(float(value), 4)
+
+
+WU_ROUTER_RATE = JsonPathExtractor("$.data.products.products[7].strikeExchangeRate", wu_rate)
+WU_USD_CATALOG_RATE = JsonPathExtractor("$.categories[0].services[0].strike_fx_rate", wu_rate)
+WU_EUR_CATALOG_RATE = JsonPathExtractor(
+    "$.services_groups[1].pay_groups[0].strike_fx_rate", wu_rate
+)
+WU_CATALOG_RATES = {"USD": WU_USD_CATALOG_RATE, "EUR": WU_EUR_CATALOG_RATE}
+MYEASYTRANSFER_RATE = JsonPathExtractor("$.fxRate.fxRateBank")
+LEMFI_RATE = RegexExtractor(r"=\D*?([\d.,]+)")
+
+
+def wu_intercepts(
+    from_currency: str, router: str = TARGET_ENDPOINT, catalog: str = US_TARGET_ENDPOINT
+) -> tuple:
+    intercepts = [(url_startswith(router), WU_ROUTER_RATE)]
+    if from_currency in WU_CATALOG_RATES:
+        intercepts.append((url_contains(catalog), WU_CATALOG_RATES[from_currency]))
+    return tuple(intercepts)
+
+
+PROVIDERS = {
+    "MG": Provider(
+        key="MG",
+        name="MoneyGram",
+        route="/moneygram",
+        headless=headless_for("MG"),
+        session_file=SESSION_FILE,
+        pairs={
+            pair: PairSpec(
+                method="json",
+                url=MONEYGRAM_API_URL,
+                params=params,
+                extractor=JsonPathExtractor(f"$.feeQuotesByCurrency.{pair[1]}.fxRate"),
             )
-            # Reuse cookies/local storage
-            context = await browser.new_context(
-                storage_state=SESSION_FILE if os.path.exists(SESSION_FILE) else None
+            for pair, params in MONEYGRAM_CONFIG.items()
+        },
+    ),
+    "WU": Provider(
+        key="WU",
+        name="Western_Union",
+        route="/wu",
+        headless=headless_for("WU"),
+        pairs={
+            pair: PairSpec(
+                method="intercept", url=config["url"], intercepts=wu_intercepts(pair[0])
             )
-            page = await context.new_page()
-
-            await page.goto(url, wait_until="domcontentloaded")
-            await page.wait_for_timeout(2000)  # wait 2 seconds
-
-            # Extract JSON text from <pre>
-            raw_text = await page.inner_text("pre")
-            data = json.loads(raw_text)
-            # Save session state for next run
-            await context.storage_state(path=SESSION_FILE)
-            logging.info(f"[MG RAW TEXT] {from_currency}->{to_currency}: {raw_text}")
-            # Try to extract fxRate for whichever receive currency is present
-            fee_quotes = data.get("feeQuotesByCurrency", {})
-            fx_rate = None
-            if fee_quotes and to_currency in fee_quotes:
-                fx_rate = fee_quotes[to_currency].get("fxRate")
-
-            await browser.close()
-            return fx_rate
-    except Exception as e:
-        logging.error(f"[MG EXCEPTION] {from_currency}->{to_currency}: {e}")
-        return None
+            for pair, config in WU_CONFIG.items()
+        },
+    ),
+    "LEMFI": Provider(
+        key="LEMFI",
+        name="Lemfi",
+        route="/lemfi",
+        headless=headless_for("LEMFI"),
+        pairs={
+            pair: PairSpec(
+                method="selector",
+                url=config["url"],
+                selector=config["selector"],
+                extractor=LEMFI_RATE,
+            )
+            for pair, config in LEMFI_CONFIG.items()
+        },
+    ),
+    "MET": Provider(
+        key="MET",
+        name="MyEasyTransfer",
+        route="/myeasytransfer",
+        headless=headless_for("MET"),
+        pairs={
+            pair: PairSpec(
+                method="json",
+                url=MYEASYTRANSFER_API_URL,
+                params=params,
+                extractor=MYEASYTRANSFER_RATE,
+            )
+            for pair, params in MYEASYTRANSFER_CONFIG.items()
+        },
+    ),
+}
+
+
+# --- Scrapers ---
+async def fetch_json_browser(
+    provider: Provider, url: str, from_currency: str, to_currency: str
+) -> dict:
+    # Reuse cookies/local storage
+    session_file = provider.session_file
+    async with browser_pool.lease(
+        headless=provider.headless,
+        storage_state=session_file if session_file and os.path.exists(session_file) else None,
+    ) as context:
+        page = await context.new_page()
+        started = time.monotonic()
+        await navigate(page, provider.key, url, started)
+
+        # Extract JSON text from <pre> as soon as it is rendered
+        pre = await page.wait_for_selector("pre", timeout=remaining_ms(provider.key, started))
+        raw_text = await pre.inner_text()
+        record_wait(provider.key, from_currency, to_currency, started)
+        data = json.loads(raw_text)
+        if session_file:
+            # Save session state for the next run (also picked up by the HTTP client)
+            await context.storage_state(path=session_file)
+        return data
 
 
-# --- Western Union scraper ---
-async def fetch_wu_rate(from_currency: str, to_currency: str) -> float | None:
-    config = WU_CONFIG.get((from_currency, to_currency))
-    if not config:
-        raise ValueError(f"No config found for {from_currency} → {to_currency}")
+async def fetch_json_rate(
+    provider: Provider, spec: PairSpec, from_currency: str, to_currency: str
+):
+    data = None
+    if HTTP_FAST_PATH:
+        try:
+            started = time.monotonic()
+            with span("http"):
+                data = await fetch_json(spec.url, spec.params)
+            record_wait(provider.key, from_currency, to_currency, started)
+        except BotChallenge as e:
+            logging.warning(
+                f"[{provider.key} CHALLENGE] {from_currency}->{to_currency}: {e}, using browser"
+            )
+    if data is None:
+        url = f"{spec.url}?{urlencode(spec.params)}" if spec.params else spec.url
+        data = await fetch_json_browser(provider, url, from_currency, to_currency)
+    # Payloads can be large; only format them when debugging
+    if logging.root.isEnabledFor(logging.DEBUG):
+        logging.debug(f"[{provider.key} RAW TEXT] {from_currency}->{to_currency}: {data}")
+    return spec.extractor(data)
 
-    url = config["url"]
-    rate: float | None = None
+
+async def fetch_intercepted_rate(
+    provider: Provider, spec: PairSpec, from_currency: str, to_currency: str
+):
+    rate = None
     rate_event = asyncio.Event()
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
-        page = await browser.new_page()
+    async with browser_pool.lease(headless=provider.headless) as context:
+        page = await context.new_page()
+        if provider.key in BLOCK_POLICIES:
+            await apply_block_policy(page, provider.key)
 
         async def handle_response(response):
             nonlocal rate
-            try:
-                if response.url.startswith(TARGET_ENDPOINT):
-                    data = await response.json()
-                    expr = parse("$.data.products.products[7].strikeExchangeRate")
-                elif (
-                    from_currency.upper() == "USD"
-                    and US_TARGET_ENDPOINT in response.url
-                ):
-                    data = await response.json()
-                    expr = parse("$.categories[0].services[0].strike_fx_rate")
-                elif (
-                    from_currency.upper() == "EUR"
-                    and US_TARGET_ENDPOINT in response.url
-                ):
-                    data = await response.json()
-                    expr = parse("$.services_groups[1].pay_groups[0].strike_fx_rate")
-                else:
+            for matches, extractor in spec.intercepts:
+                if not matches(response.url):
+                    continue
+                try:
+                    value = extractor(await response.json())
+                except Exception as e:
+                    logging.error(
+                        f"[{provider.key} EXCEPTION] {from_currency}->{to_currency}: {e}"
+                    )
                     return
-
-                matches = [m.value for m in expr.find(data)]
-                if matches:
-                    rate = round(float(matches[0]), 4)
-                    print(f"🎯 {from_currency}->{to_currency} strikeExchangeRate:", rate)
+                if value is not None:
+                    rate = value
+                    logging.debug(f"[{provider.key} RATE] {from_currency}->{to_currency}: {rate}")
                     rate_event.set()
-            except Exception as e:
-                print("⚠️ Could not parse JSON:", e)
-                logging.error(f"[WU EXCEPTION] {from_currency}->{to_currency}: {e}")
+                return
 
         page.on("response", handle_response)
 
-        await page.goto(url, timeout=60000)
-        await page.wait_for_timeout(15000)
+        started = time.monotonic()
+        # Wait until the handler sets the event; a missed deadline raises to run_scrape
+        await navigate(page, provider.key, spec.url, started)
+        await asyncio.wait_for(
+            rate_event.wait(), timeout=remaining_ms(provider.key, started) / 1000
+        )
+        record_wait(provider.key, from_currency, to_currency, started)
+        return rate
 
-        # Wait until the handler sets the event or timeout
-        try:
-            await asyncio.wait_for(rate_event.wait(), timeout=15)
-        except asyncio.TimeoutError:
-            print("⚠️ Timed out waiting for WU JSON")
-            logging.error("Timed out waiting for WU JSON")
 
-        await browser.close()
-        return rate
+async def fetch_selector_rate(
+    provider: Provider, spec: PairSpec, from_currency: str, to_currency: str
+):
+    async with browser_pool.lease(headless=provider.headless) as context:
+        page = await context.new_page()
+        if provider.key in BLOCK_POLICIES:
+            await apply_block_policy(page, provider.key)
+        started = time.monotonic()
+        await navigate(page, provider.key, spec.url, started)
+        element = await page.wait_for_selector(
+            spec.selector, timeout=remaining_ms(provider.key, started)
+        )
+        text = await element.inner_text()
+        record_wait(provider.key, from_currency, to_currency, started)
+        logging.debug(f"[{provider.key} RAW TEXT] {from_currency}->{to_currency}: {text}")
+        return spec.extractor(text)
 
 
+FETCH_METHODS = {
+    "json": fetch_json_rate,
+    "intercept": fetch_intercepted_rate,
+    "selector": fetch_selector_rate,
+}
+
 
-# --- Lemfi scraper ---
-async def fetch_lemfi_rate(from_currency: str, to_currency: str) -> float | None:
-    key = (from_currency.upper(), to_currency.upper())
-    if key not in LEMFI_CONFIG:
-        logging.error(f"[LemFi ERROR] Unsupported pair {from_currency}->{to_currency}")
+async def fetch_rate(provider_key: str, from_currency: str, to_currency: str):
+    provider = PROVIDERS[provider_key]
+    spec = provider.pairs.get((from_currency.upper(), to_currency.upper()))
+    if spec is None:
+        logging.error(f"[{provider_key} ERROR] Unsupported pair {from_currency}->{to_currency}")
         return None
+    return await FETCH_METHODS[spec.method](provider, spec, from_currency, to_currency)
+
+
+# --- TapTap scraper ---
+# One fxRates response holds every corridor, so it is fetched once and kept
+# as a (source, target) -> rate index. Concurrent misses share one request.
+TAPTAP_TTL = int(os.getenv("TAPTAP_TTL", "300"))
+taptap_index: dict[tuple[str, str], float] = {}
+taptap_fetched_at = 0.0
+taptap_inflight: asyncio.Task | None = None
+
 
-    config = LEMFI_CONFIG[key]
+def build_taptap_index(data: dict) -> dict[tuple[str, str], float]:
+    index = {}
+    for country in data.get("availableCountries", []):
+        source = country.get("currency")
+        for corridor in country.get("corridors", []):
+            try:
+                index[(source, corridor.get("currency"))] = float(corridor.get("fxRate"))
+            except (TypeError, ValueError):
+                continue
+    return index
+
+
+async def fetch_taptap_index() -> dict[tuple[str, str], float]:
+    global taptap_index, taptap_fetched_at
+    response = await get_http_client().get(TAPTAP_URL, headers=TAPTAP_HEADERS)
+    response.raise_for_status()
+    taptap_index = build_taptap_index(response.json())
+    taptap_fetched_at = time.time()
+    logging.info(f"[TAPTAP] indexed {len(taptap_index)} corridors")
+    return taptap_index
+
+
+async def get_taptap_index(max_age: float = TAPTAP_TTL) -> dict[tuple[str, str], float]:
+    global taptap_inflight
+    if taptap_index and time.time() - taptap_fetched_at < max_age:
+        return taptap_index
+    if taptap_inflight is None or taptap_inflight.done():
+        taptap_inflight = asyncio.create_task(fetch_taptap_index())
+    return await asyncio.shield(taptap_inflight)
+
+
+async def fetch_taptap_rates() -> dict:
     try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(
-                headless=True, args=["--disable-blink-features=AutomationControlled"]
-            )
-            page = await browser.new_page()
-            await page.goto(config["url"], wait_until="networkidle", timeout=30000)
-            await page.wait_for_timeout(3000)  # wait 3 seconds
-            await page.wait_for_selector(config["selector"], timeout=30000)
-            text = await page.locator(config["selector"]).inner_text()
-            text = text.split("=")[1].strip()
-            rate = re.search(r"([\d.,]+)", text).group(1)
-            logging.info(f"[LemFi RAW TEXT] {from_currency}->{to_currency}: {text}")
-
-            await browser.close()
-            return rate
+        index = await get_taptap_index(max_age=0)
     except Exception as e:
-        logging.error(f"[LemFi EXCEPTION] {from_currency}->{to_currency}: {e}")
-        return None
+        logging.error(f"[TAPTAP EXCEPTION] {e}")
+        return {}
+    return {f"TAPTAP_{source}_{target}": rate for (source, target), rate in index.items()}
 
 
-# --- Refresh endpoint ---
-async def refresh():
-    while True:
-        results = {}
+# --- Refresh scheduler ---
+REFRESH_MAX_CONCURRENCY = int(os.getenv("REFRESH_MAX_CONCURRENCY", "6"))
+# Per-provider caps so a concurrent cycle doesn't get us rate-limited
+PROVIDER_CONCURRENCY = {"MG": 2, "WU": 3, "LEMFI": 2, "MET": 1}
+
+refresh_semaphore = asyncio.Semaphore(REFRESH_MAX_CONCURRENCY)
+provider_semaphores = {
+    provider: asyncio.Semaphore(limit) for provider, limit in PROVIDER_CONCURRENCY.items()
+}
+
 
-        for from_cur, to_cur in MONEYGRAM_CONFIG.keys():
-            results[f"MG_{from_cur}_{to_cur}"] = await fetch_moneygram_rate(
-                from_cur, to_cur
+# --- Circuit breakers ---
+# A provider (or a single pair) that keeps failing is skipped for an
+# exponentially growing backoff, then allowed exactly one half-open probe.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_BASE_BACKOFF = int(os.getenv("BREAKER_BASE_BACKOFF", "60"))
+BREAKER_MAX_BACKOFF = int(os.getenv("BREAKER_MAX_BACKOFF", "3600"))
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.failures < BREAKER_FAILURE_THRESHOLD:
+            return "closed"
+        if time.monotonic() < self.open_until:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open" or self.probing:
+            return False
+        self.probing = True
+        logging.info(f"[BREAKER] {self.name} half-open, probing")
+        return True
+
+    def cancel_probe(self):
+        self.probing = False
+
+    def record_success(self):
+        if self.failures >= BREAKER_FAILURE_THRESHOLD:
+            logging.info(f"[BREAKER] {self.name} closed")
+        self.failures = 0
+        self.trips = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.failures >= BREAKER_FAILURE_THRESHOLD:
+            backoff = min(BREAKER_BASE_BACKOFF * 2**self.trips, BREAKER_MAX_BACKOFF)
+            self.trips += 1
+            self.open_until = time.monotonic() + backoff
+            logging.warning(f"[BREAKER] {self.name} open for {backoff}s")
+
+
+provider_breakers = {key: CircuitBreaker(key) for key in PROVIDERS}
+pair_breakers = {
+    f"{provider.key}_{from_cur}_{to_cur}": CircuitBreaker(f"{provider.key}_{from_cur}_{to_cur}")
+    for provider in PROVIDERS.values()
+    for from_cur, to_cur in provider.pairs
+}
+
+
+def breakers_allow(provider: str, key: str) -> bool:
+    pair_breaker = pair_breakers[key]
+    if not pair_breaker.allow():
+        return False
+    if not provider_breakers[provider].allow():
+        pair_breaker.cancel_probe()
+        return False
+    return True
+
+
+async def attempt_scrape(provider: str, from_cur: str, to_cur: str) -> tuple:
+    # One fetch, classified for metrics/retries: (rate, result, elapsed seconds)
+    started = time.monotonic()
+    try:
+        rate = await fetch_rate(provider, from_cur, to_cur)
+        result = "failure" if rate is None else "success"
+    except timeout_errors():
+        logging.error(f"[{provider} TIMEOUT] {from_cur}->{to_cur}: no rate in time")
+        rate = None
+        result = "timeout"
+    except Exception as e:
+        logging.error(f"[{provider} EXCEPTION] {from_cur}->{to_cur}: {e}")
+        rate = None
+        result = "failure"
+    return rate, result, time.monotonic() - started
+
+
+def settle_scrape(
+    provider: str, from_cur: str, to_cur: str, rate, elapsed: float, fetched_at: float | None = None
+):
+    # fetched_at: when the scrape finished, if not just now (queue results)
+    key = f"{provider}_{from_cur}_{to_cur}"
+    scrape_duration.observe(elapsed, provider)
+    for breaker in (pair_breakers[key], provider_breakers[provider]):
+        if rate is None:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    with span("publish"):
+        record_rate(key, rate)
+        publish_entries({key: rate}, fetched_at)
+    logging.info(f"[NEW {provider} RATE ADDED] {from_cur}->{to_cur} in {elapsed:.1f}s")
+
+
+async def run_scrape(provider: str, from_cur: str, to_cur: str):
+    key = f"{provider}_{from_cur}_{to_cur}"
+    spans = [] if TRACE_SPANS else None
+    token = current_trace.set(spans)
+    queued = time.monotonic()
+    result = "cancelled"
+    try:
+        # Take the provider slot first so a throttled provider doesn't hold a global one
+        async with provider_semaphores[provider]:
+            # Checked once we hold the slot, so queued jobs see breakers tripped meanwhile
+            if not breakers_allow(provider, key):
+                logging.info(f"[{provider} SKIPPED] {from_cur}->{to_cur}: circuit open")
+                result = "skipped"
+                return None
+            async with refresh_semaphore:
+                add_span("queued", time.monotonic() - queued)
+                rate, result, elapsed = await attempt_scrape(provider, from_cur, to_cur)
+                settle_scrape(provider, from_cur, to_cur, rate, elapsed)
+                return rate
+    finally:
+        current_trace.reset(token)
+        scrape_results.inc(provider, result)
+        if spans is not None:
+            trace = {
+                "key": key,
+                "result": result,
+                "total_ms": round((time.monotonic() - queued) * 1000, 1),
+                "spans": spans,
+            }
+            logging.info(f"[TRACE] {json.dumps(trace)}")
+
+
+async def run_taptap() -> bool:
+    results = await fetch_taptap_rates()
+    fetched = bool(results)
+    if not fetched:
+        # Keep the last TapTap corridors around, flagged stale
+        known = snapshot.rates if snapshot else {}
+        results = {key: None for key in known if key.startswith("TAPTAP_")}
+    publish_entries(results)
+    return fetched
+
+
+# --- Scrape work queue ---
+# With SCRAPE_MODE=queue the leader doesn't scrape: it enqueues (provider,
+# pair) jobs in a SQLite file and scrape_worker.py processes lease them, fetch,
+# and report back. The leader collects results and settles them exactly like
+# local scrapes (breakers, history, snapshot). One row per pair, so a pair is
+# never queued twice. A lease that isn't completed in time (worker died) is
+# handed out again; failed attempts are retried with backoff up to
+# QUEUE_MAX_ATTEMPTS. Results keep the worker's completion time, which is
+# what gets published as fetched_at. A new leader resets rows left over by
+# its predecessor that are older than the lease window instead of publishing
+# them. SQLite needs a local filesystem, so across nodes this file has to be
+# swapped for a networked backend with the same operations.
+SCRAPE_MODE = os.getenv("SCRAPE_MODE", "local")
+SCRAPE_QUEUE_FILE = os.getenv("SCRAPE_QUEUE_FILE", "scrape_queue.db")
+QUEUE_LEASE_SECONDS = int(os.getenv("QUEUE_LEASE_SECONDS", "120"))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+QUEUE_RETRY_BACKOFF = int(os.getenv("QUEUE_RETRY_BACKOFF", "30"))
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "1"))
+
+QUEUE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    from_cur TEXT NOT NULL,
+    to_cur TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    rate TEXT,
+    result TEXT,
+    elapsed REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, available_at);
+"""
+
+
+class ScrapeQueue:
+    # Job states: queued -> leased -> done | failed -> idle (collected by the leader)
+    def __init__(self, path: str):
+        # Autocommit; every operation runs in its own BEGIN IMMEDIATE transaction
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(QUEUE_SCHEMA)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        if "finished_at" not in columns:
+            # Queue files created before results carried their completion time
+            self.db.execute("ALTER TABLE jobs ADD COLUMN finished_at REAL")
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    def enqueue(self, provider: str, from_cur: str, to_cur: str) -> bool:
+        # False if the pair is already queued, leased or waiting to be collected
+        key = f"{provider}_{from_cur}_{to_cur}"
+        with self.transaction() as db:
+            cursor = db.execute(
+                """INSERT INTO jobs (key, provider, from_cur, to_cur, state, available_at)
+                VALUES (?, ?, ?, ?, 'queued', ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    state = 'queued', attempts = 0, available_at = excluded.available_at,
+                    lease_owner = NULL, lease_expires = NULL,
+                    rate = NULL, result = NULL, elapsed = NULL, finished_at = NULL
+                WHERE state = 'idle'""",
+                (key, provider, from_cur, to_cur, time.time()),
             )
-            logging.info("[NEW MG RATE ADDED]")
-            results[f"WU_{from_cur}_{to_cur}"] = await fetch_wu_rate(from_cur, to_cur)
-            logging.info("[NEW WU RATE ADDED]")
-            results[f"LEMFI_{from_cur}_{to_cur}"] = await fetch_lemfi_rate(
-                from_cur, to_cur
+            return cursor.rowcount > 0
+
+    def expire_leases(self, db, now: float):
+        db.execute(
+            """UPDATE jobs SET state = 'failed', result = 'lease expired', lease_owner = NULL
+            WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?""",
+            (now, QUEUE_MAX_ATTEMPTS),
+        )
+        db.execute(
+            """UPDATE jobs SET state = 'queued', lease_owner = NULL
+            WHERE state = 'leased' AND lease_expires < ?""",
+            (now,),
+        )
+
+    def lease(self, worker: str, providers: tuple[str, ...] = ()) -> tuple | None:
+        now = time.time()
+        query = "SELECT key, provider, from_cur, to_cur FROM jobs WHERE state = 'queued' AND available_at <= ?"
+        params = [now]
+        if providers:
+            query += f" AND provider IN ({','.join('?' * len(providers))})"
+            params += providers
+        query += " ORDER BY available_at LIMIT 1"
+        with self.transaction() as db:
+            self.expire_leases(db, now)
+            row = db.execute(query, params).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                """UPDATE jobs SET state = 'leased', attempts = attempts + 1,
+                    lease_owner = ?, lease_expires = ? WHERE key = ?""",
+                (worker, now + QUEUE_LEASE_SECONDS, row[0]),
+            )
+            return row
+
+    def report(self, key: str, worker: str, rate, result: str, elapsed: float) -> bool:
+        # Only the current lease holder may report; False if the lease was lost
+        with self.transaction() as db:
+            row = db.execute(
+                "SELECT attempts FROM jobs WHERE key = ? AND state = 'leased' AND lease_owner = ?",
+                (key, worker),
+            ).fetchone()
+            if row is None:
+                return False
+            if rate is None and row[0] < QUEUE_MAX_ATTEMPTS:
+                backoff = QUEUE_RETRY_BACKOFF * 2 ** (row[0] - 1)
+                db.execute(
+                    """UPDATE jobs SET state = 'queued', lease_owner = NULL,
+                        available_at = ?, result = ? WHERE key = ?""",
+                    (time.time() + backoff, result, key),
+                )
+                return True
+            db.execute(
+                """UPDATE jobs SET state = ?, lease_owner = NULL, rate = ?,
+                    result = ?, elapsed = ?, finished_at = ? WHERE key = ?""",
+                (
+                    "failed" if rate is None else "done",
+                    None if rate is None else json.dumps(rate),
+                    result,
+                    elapsed,
+                    time.time(),
+                    key,
+                ),
             )
-            logging.info("[NEW LEMFI RATE ADDED]")
-            results[f"MET_{from_cur}_{to_cur}"] = await fetch_myeasytransfer_rate(
-                from_cur, to_cur
+            return True
+
+    def collect(self) -> list[tuple]:
+        # Finished jobs as (provider, from, to, rate, result, elapsed, finished_at), marked idle
+        with self.transaction() as db:
+            self.expire_leases(db, time.time())
+            rows = db.execute(
+                """SELECT key, provider, from_cur, to_cur, rate, result, elapsed, finished_at
+                FROM jobs WHERE state IN ('done', 'failed')"""
+            ).fetchall()
+            db.executemany("UPDATE jobs SET state = 'idle' WHERE key = ?", [(r[0],) for r in rows])
+        return [
+            (provider, from_cur, to_cur, None if rate is None else json.loads(rate), *rest)
+            for _, provider, from_cur, to_cur, rate, *rest in rows
+        ]
+
+    def reset_leftovers(self, now: float) -> int:
+        # Called when a leader takes over: results and queued jobs from before
+        # the lease window go back to idle unpublished (the scheduler queues
+        # them again). Leases are left alone, their worker may still report.
+        cutoff = now - QUEUE_LEASE_SECONDS
+        with self.transaction() as db:
+            cursor = db.execute(
+                """UPDATE jobs SET state = 'idle', lease_owner = NULL, lease_expires = NULL,
+                    rate = NULL, result = NULL, elapsed = NULL, finished_at = NULL
+                WHERE (state IN ('done', 'failed') AND (finished_at IS NULL OR finished_at < ?))
+                    OR (state = 'queued' AND available_at < ?)""",
+                (cutoff, cutoff),
             )
-            logging.info("[NEW EASYTR RATE ADDED]")
+            return cursor.rowcount
 
-        # --- Write to temp file first ---
-        new_cache = {"timestamp": time.time(), "rates": results}
-        with open(TEMP_CACHE_FILE, "w") as f:
-            json.dump(new_cache, f)
+    def close(self):
+        self.db.close()
 
-        # --- Atomically replace main cache file ---
-        os.replace(TEMP_CACHE_FILE, CACHE_FILE)
 
-        logging.info("[CACHE UPDATED]")
-        # sleep 2 hours
-        await asyncio.sleep(7200)
+scrape_queue: ScrapeQueue | None = None
+# Leader-side futures for queued pairs, resolved by collect_queue_results()
+queue_waiters: dict[str, asyncio.Future] = {}
 
 
-# --- Endpoints that read cache ---
-@app.get("/moneygram")
-async def moneygram(from_currency: str = Query(...), to_currency: str = Query(...)):
-    if not os.path.exists(CACHE_FILE):
-        return {"MoneyGram": None, "error": "Cache not ready"}
-    with open(CACHE_FILE, "r") as f:
-        cache = json.load(f)
-    key = f"MG_{from_currency.upper()}_{to_currency.upper()}"
-    return {"MoneyGram": cache["rates"].get(key), "cached_at": cache["timestamp"]}
+async def queue_scrape(provider: str, from_cur: str, to_cur: str):
+    key = f"{provider}_{from_cur}_{to_cur}"
+    if not breakers_allow(provider, key):
+        logging.info(f"[{provider} SKIPPED] {from_cur}->{to_cur}: circuit open")
+        scrape_results.inc(provider, "skipped")
+        return None
+    # Registered even if the pair is already in the queue (e.g. left over by a
+    # previous leader): its result resolves this waiter all the same
+    waiter = queue_waiters.get(key)
+    if waiter is None:
+        waiter = queue_waiters[key] = asyncio.get_running_loop().create_future()
+    await asyncio.to_thread(scrape_queue.enqueue, provider, from_cur, to_cur)
+    return await asyncio.shield(waiter)
 
 
-@app.get("/wu")
-async def wu(from_currency: str = Query(...), to_currency: str = Query(...)):
-    if not os.path.exists(CACHE_FILE):
-        return {"Western_Union": None, "error": "Cache not ready"}
-    with open(CACHE_FILE, "r") as f:
-        cache = json.load(f)
-    key = f"WU_{from_currency.upper()}_{to_currency.upper()}"
-    return {"Western_Union": cache["rates"].get(key), "cached_at": cache["timestamp"]}
+async def collect_queue_results():
+    while True:
+        try:
+            for provider, from_cur, to_cur, rate, result, elapsed, finished_at in await asyncio.to_thread(
+                scrape_queue.collect
+            ):
+                scrape_results.inc(provider, result if result in ("success", "timeout") else "failure")
+                settle_scrape(provider, from_cur, to_cur, rate, elapsed or 0.0, finished_at)
+                waiter = queue_waiters.pop(f"{provider}_{from_cur}_{to_cur}", None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(rate)
+        except Exception as e:
+            logging.error(f"[QUEUE COLLECT ERROR] {e}")
+        await asyncio.sleep(QUEUE_POLL_INTERVAL)
+
+
+async def submit_scrape(provider: str, from_cur: str, to_cur: str):
+    if SCRAPE_MODE == "queue":
+        return await queue_scrape(provider, from_cur, to_cur)
+    return await run_scrape(provider, from_cur, to_cur)
+
+
+async def scrape_worker(providers: tuple[str, ...] = (), concurrency: int = REFRESH_MAX_CONCURRENCY):
+    # Entry point for scrape_worker.py: lease, fetch, report, until cancelled
+    global scrape_queue
+    scrape_queue = ScrapeQueue(SCRAPE_QUEUE_FILE)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    logging.info(f"[WORKER] {worker} leasing {', '.join(providers) or 'all providers'}")
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def lease_loop(provider: str):
+        while True:
+            # Both slots are held before leasing, so a leased job never waits on
+            # a local semaphore while its lease clock runs
+            async with slots, provider_semaphores[provider]:
+                job = await asyncio.to_thread(scrape_queue.lease, worker, (provider,))
+                if job is not None:
+                    key, _, from_cur, to_cur = job
+                    rate, result, elapsed = await attempt_scrape(provider, from_cur, to_cur)
+                    reported = await asyncio.to_thread(
+                        scrape_queue.report, key, worker, rate, result, elapsed
+                    )
+            if job is None:
+                await asyncio.sleep(QUEUE_POLL_INTERVAL)
+            elif not reported:
+                logging.warning(f"[WORKER] lease on {key} expired before the result was reported")
+            else:
+                logging.info(f"[WORKER] {key}: {result} in {elapsed:.1f}s")
+
+    # One loop per provider slot; `slots` caps how many run at once
+    loops = [
+        lease_loop(provider)
+        for provider in providers or tuple(PROVIDERS)
+        for _ in range(min(PROVIDER_CONCURRENCY.get(provider, 1), concurrency))
+    ]
+    try:
+        await asyncio.gather(publish_metrics_loop(), *loops)
+    finally:
+        await close_http_client()
+        await browser_pool.close()
+        scrape_queue.close()
+        remove_metrics_dump()
+
+
+# --- Adaptive scheduling ---
+# Each job's refresh interval shrinks from REFRESH_MAX_INTERVAL towards
+# REFRESH_MIN_INTERVAL with read demand (exponentially decayed hits on the
+# cache endpoints) and with recent rate volatility. Pairs nobody reads and
+# whose rate doesn't move stay at the max interval.
+REFRESH_MIN_INTERVAL = int(os.getenv("REFRESH_MIN_INTERVAL", "600"))
+REFRESH_MAX_INTERVAL = int(os.getenv("REFRESH_MAX_INTERVAL", "21600"))
+SCHEDULER_TICK = int(os.getenv("SCHEDULER_TICK", "30"))
+# Failed or breaker-skipped jobs are retried after this, not after their interval
+REFRESH_RETRY_DELAY = int(os.getenv("REFRESH_RETRY_DELAY", "60"))
+DEMAND_HALF_LIFE = int(os.getenv("DEMAND_HALF_LIFE", "3600"))
+DEMAND_WEIGHT = 2.0
+# Mean relative move between scrapes that counts as "one unit" of volatility
+VOLATILITY_REFERENCE = 0.001
+VOLATILITY_WINDOW = 8
+DEMAND_FILE = os.getenv(
+    "DEMAND_FILE", "/dev/shm/fx_demand.shm" if os.path.isdir("/dev/shm") else "fx_demand.shm"
+)
+TAPTAP_JOB = ("TAPTAP", "*", "*")
+
+SCRAPE_KEYS = sorted(pair_breakers)
+DEMAND_SLOTS = {key: index for index, key in enumerate(SCRAPE_KEYS)}
+DEMAND_SLOT = struct.Struct("<Q")
+
 
+# Read counters shared by all workers in one memory-mapped file, one uint64
+# slot per scrape key. Increments from different workers can race; losing
+# the odd hit is fine for a demand estimate.
+class DemandCounters:
+    def __init__(self, path: str, slots: int):
+        size = DEMAND_SLOT.size * max(slots, 1)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def increment(self, slot: int):
+        offset = slot * DEMAND_SLOT.size
+        DEMAND_SLOT.pack_into(self.mm, offset, DEMAND_SLOT.unpack_from(self.mm, offset)[0] + 1)
+
+    def read(self, slot: int) -> int:
+        return DEMAND_SLOT.unpack_from(self.mm, slot * DEMAND_SLOT.size)[0]
+
+    def close(self):
+        self.mm.close()
+
+
+demand_counters: DemandCounters | None = None
+demand_seen: dict[str, int] = {}
+demand_scores: dict[str, tuple[float, float]] = {}  # key -> (score, updated_at)
+recent_rates: dict[str, deque] = {}
+
+
+def record_read(key: str):
+    slot = DEMAND_SLOTS.get(key)
+    if slot is not None and demand_counters is not None:
+        demand_counters.increment(slot)
+
+
+def decayed_demand(key: str, now: float) -> float:
+    score, updated = demand_scores.get(key, (0.0, now))
+    return score * 0.5 ** ((now - updated) / DEMAND_HALF_LIFE)
+
+
+def collect_demand(now: float):
+    if demand_counters is None:
+        return
+    for key, slot in DEMAND_SLOTS.items():
+        count = demand_counters.read(slot)
+        hits = count - demand_seen.get(key, count)
+        demand_seen[key] = count
+        demand_scores[key] = (decayed_demand(key, now) + max(hits, 0), now)
+
+
+def to_float(rate) -> float | None:
+    if rate is None:
+        return None
+    try:
+        return float(str(rate).replace(",", ""))
+    except ValueError:
+        return None
+
+
+def record_rate(key: str, rate):
+    value = to_float(rate)
+    if value is not None:
+        recent_rates.setdefault(key, deque(maxlen=VOLATILITY_WINDOW)).append(value)
+
+
+def volatility(key: str) -> float:
+    values = recent_rates.get(key)
+    if not values or len(values) < 2:
+        return 0.0
+    moves = [abs(b - a) / a for a, b in zip(values, list(values)[1:]) if a]
+    return sum(moves) / len(moves) if moves else 0.0
+
+
+def refresh_interval(job: tuple[str, str, str], now: float) -> float:
+    if job == TAPTAP_JOB:
+        # One cheap HTTP call covers every TapTap corridor
+        return REFRESH_MIN_INTERVAL
+    key = "_".join(job)
+    pressure = (
+        1
+        + DEMAND_WEIGHT * math.log1p(decayed_demand(key, now))
+        + volatility(key) / VOLATILITY_REFERENCE
+    )
+    return min(max(REFRESH_MAX_INTERVAL / pressure, REFRESH_MIN_INTERVAL), REFRESH_MAX_INTERVAL)
+
+
+async def run_job(job: tuple[str, str, str]) -> bool:
+    # True when the job produced fresh data
+    if job == TAPTAP_JOB:
+        return await run_taptap()
+    return await submit_scrape(*job) is not None
+
+
+def retry_delay(job: tuple[str, str, str]) -> float:
+    if job == TAPTAP_JOB:
+        return REFRESH_RETRY_DELAY
+    # Don't come back before the breakers would let a probe through
+    breakers = (pair_breakers["_".join(job)], provider_breakers[job[0]])
+    reopens = max(breaker.open_until for breaker in breakers) - time.monotonic()
+    return max(REFRESH_RETRY_DELAY, reopens)
+
+
+def last_scraped(snap: "RateSnapshot | None", job: tuple[str, str, str]) -> float:
+    if snap is None:
+        return 0.0
+    if job == TAPTAP_JOB:
+        times = [
+            entry.get("fetched_at") or 0.0
+            for key, entry in snap.rates.items()
+            if key.startswith("TAPTAP_")
+        ]
+        return min(times, default=0.0)
+    entry = snap.rates.get("_".join(job)) or {}
+    return entry.get("fetched_at") or 0.0
+
+
+async def refresh():
+    jobs = [TAPTAP_JOB] + [tuple(key.split("_")) for key in SCRAPE_KEYS]
+    # Seeded from the loaded snapshot: after a restart, missing and oldest
+    # entries come due (and are dispatched) first, fresh ones wait their turn
+    snap = current_snapshot()
+    last_run = {job: last_scraped(snap, job) for job in jobs}
+    # Due time of jobs whose last run failed or was skipped by a breaker
+    retry_at: dict[tuple, float] = {}
+    running: dict[tuple, asyncio.Task] = {}
+    batch_timers: set[asyncio.Task] = set()
+
+    def finished(job, task):
+        running.pop(job, None)
+        if not task.cancelled() and task.exception() is None and task.result():
+            last_run[job] = time.time()
+            retry_at.pop(job, None)
+        else:
+            # last_run stays at the last success, so the interval can't hide
+            # a failing pair for hours
+            retry_at[job] = time.time() + retry_delay(job)
+
+    async def time_batch(batch: list[asyncio.Task], started: float):
+        # A "cycle" here is one tick's dispatched jobs, from dispatch to the last one done
+        await asyncio.wait(batch)
+        elapsed = time.monotonic() - started
+        cycle_duration.observe(elapsed)
+        logging.info(
+            f"[CYCLE] {len(batch)} jobs in {elapsed:.1f}s (concurrency={REFRESH_MAX_CONCURRENCY})"
+        )
+        log_blocked_traffic()
+
+    try:
+        while True:
+            now = time.time()
+            collect_demand(now)
+            # Rebuilt every tick so demand/volatility changes move due times
+            queue = [
+                (retry_at.get(job) or last_run[job] + refresh_interval(job, now), job)
+                for job in jobs
+                if job not in running
+            ]
+            heapq.heapify(queue)
+            batch = []
+            while queue and queue[0][0] <= now:
+                _, job = heapq.heappop(queue)
+                task = asyncio.create_task(run_job(job))
+                task.add_done_callback(lambda t, job=job: finished(job, t))
+                running[job] = task
+                batch.append(task)
+            if batch:
+                timer = asyncio.create_task(time_batch(batch, time.monotonic()))
+                batch_timers.add(timer)
+                timer.add_done_callback(batch_timers.discard)
+                logging.info(f"[SCHEDULER] dispatched {len(batch)} jobs, {len(running)} running")
+            next_due = queue[0][0] - now if queue else SCHEDULER_TICK
+            await asyncio.sleep(min(max(next_due, 1), SCHEDULER_TICK))
+    finally:
+        for task in [*running.values(), *batch_timers]:
+            task.cancel()
+
+
+# --- Cross rates ---
+# Per provider, sender->receiver corridors that aren't scraped are derived
+# through that provider's own quotes, walking scraped legs backwards as 1/rate
+# in between: providers never quote sender->sender, so e.g. USD->TND comes from
+# USD->INR, INR->CAD (1 / CAD->INR) and CAD->TND. Only currencies the provider
+# sends from are sources, and the last leg must be a real quote, so nothing
+# like MXN->COP is invented. Shorter paths win, then paths with fewer
+# inverted legs, then the better rate.
+CROSS_RATE_MAX_LEGS = int(os.getenv("CROSS_RATE_MAX_LEGS", "3"))
+
+
+def derive_cross_rates(provider: str, rates: Mapping[str, dict]) -> dict[str, dict]:
+    prefix = f"{provider}_"
+    edges: dict[str, dict[str, tuple[float, bool, dict]]] = {}
+    senders = set()
+    for key, entry in rates.items():
+        if not key.startswith(prefix):
+            continue
+        value = to_float(entry.get("rate"))
+        if not value:
+            continue
+        _, source, target = key.split("_")
+        senders.add(source)
+        edges.setdefault(source, {})[target] = (value, False, entry)
+    for source, targets in list(edges.items()):
+        for target, (value, _, entry) in list(targets.items()):
+            edges.setdefault(target, {}).setdefault(source, (1 / value, True, entry))
+
+    derived = {}
+    for source in senders:
+        best: dict[str, tuple] = {}
+        # (currency, rate, inverted legs, path, leg entries)
+        frontier = [(source, 1.0, 0, (source,), ())]
+        for legs in range(1, CROSS_RATE_MAX_LEGS + 1):
+            next_frontier = []
+            for currency, rate, inverted, path, entries in frontier:
+                for target, (value, is_inverse, entry) in edges[currency].items():
+                    if target in path:
+                        continue
+                    step = (
+                        target,
+                        rate * value,
+                        inverted + is_inverse,
+                        path + (target,),
+                        entries + (entry,),
+                    )
+                    next_frontier.append(step)
+                    if legs < 2 or is_inverse:
+                        continue
+                    if target in edges[source] and not edges[source][target][1]:
+                        # Quoted directly
+                        continue
+                    rank = (legs, step[2], -step[1])
+                    if target not in best or rank < best[target][0]:
+                        best[target] = (rank, step)
+            frontier = [step for step in next_frontier if step[0] in edges]
+        for target, (_, (_, rate, _, path, entries)) in best.items():
+            fetched = [entry["fetched_at"] for entry in entries if entry.get("fetched_at")]
+            derived[f"{provider}_{source}_{target}"] = {
+                "rate": round(rate, 6),
+                "fetched_at": min(fetched) if fetched else None,
+                "stale": any(entry.get("stale") for entry in entries),
+                "derived": True,
+                "via": list(path),
+            }
+    return derived
+
+
+# --- Provider comparison ---
+RATE_PROVIDERS = {
+    **{key: provider.name for key, provider in PROVIDERS.items()},
+    "TAPTAP": "TapTap Send",
+}
+
+
+def rank_pair(rates: Mapping[str, dict], from_currency: str, to_currency: str) -> bytes | None:
+    quotes = []
+    for provider, name in RATE_PROVIDERS.items():
+        entry = rates.get(f"{provider}_{from_currency}_{to_currency}")
+        value = to_float(entry.get("rate")) if entry else None
+        if value is not None:
+            quotes.append((value, provider, name, entry))
+    if not quotes:
+        return None
+    # More target currency per unit sent is better
+    quotes.sort(key=lambda quote: quote[0], reverse=True)
+    best = quotes[0][0]
+    return json.dumps(
+        {
+            "from": from_currency,
+            "to": to_currency,
+            "best": quotes[0][1],
+            "rankings": [
+                {
+                    "provider": provider,
+                    "name": name,
+                    "rate": value,
+                    "spread": round(best - value, 6),
+                    "spread_pct": round((best - value) / best * 100, 4) if best else 0.0,
+                    "fetched_at": entry.get("fetched_at"),
+                    "stale": entry.get("stale", False),
+                }
+                for value, provider, name, entry in quotes
+            ],
+        }
+    ).encode()
+
+
+# --- Streaming updates ---
+# One broadcaster fans changed entries out to SSE subscribers. Each one has a
+# bounded queue; a subscriber that falls STREAM_QUEUE_SIZE frames behind is
+# dropped rather than buffered. Idle subscribers only cost a heartbeat.
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "64"))
+STREAM_HEARTBEAT = int(os.getenv("STREAM_HEARTBEAT", "15"))
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "0.5"))
+
+
+class Subscriber:
+    def __init__(self, pairs: set[tuple[str, str]] | None, providers: set[str] | None):
+        self.pairs = pairs
+        self.providers = providers
+        self.queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    def wants(self, key: str) -> bool:
+        provider, from_cur, to_cur = key.split("_")
+        if self.providers is not None and provider not in self.providers:
+            return False
+        return self.pairs is None or (from_cur, to_cur) in self.pairs
+
+
+def rates_frame(snap: "RateSnapshot", keys) -> bytes:
+    fragments = b",".join(snap.encoded[key] for key in keys)
+    return b"".join(
+        [
+            f'event: rates\ndata: {{"version":{snap.version},"rates":{{'.encode(),
+            fragments,
+            b"}}\n\n",
+        ]
+    )
+
+
+class Broadcaster:
+    def __init__(self):
+        self.subscribers: set[Subscriber] = set()
+        self.dropped = 0
+
+    def subscribe(self, subscriber: Subscriber):
+        self.subscribers.add(subscriber)
 
-@app.get("/lemfi")
-async def wu(from_currency: str = Query(...), to_currency: str = Query(...)):
-    if not os.path.exists(CACHE_FILE):
-        return {"Lemfi": None, "error": "Cache not ready"}
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def drop(self, subscriber: Subscriber):
+        # Slow consumer: discard its backlog and tell its stream to end
+        self.unsubscribe(subscriber)
+        self.dropped += 1
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+        logging.warning("[STREAM] dropped slow subscriber")
+
+    def publish(self, snap: "RateSnapshot", changed: set[str]):
+        changed = sorted(key for key in changed if key in snap.encoded)
+        if not changed:
+            return
+        everything = None
+        for subscriber in list(self.subscribers):
+            if subscriber.pairs is None and subscriber.providers is None:
+                # Unfiltered subscribers share one frame
+                everything = everything or rates_frame(snap, changed)
+                frame = everything
+            else:
+                keys = [key for key in changed if subscriber.wants(key)]
+                if not keys:
+                    continue
+                frame = rates_frame(snap, keys)
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                self.drop(subscriber)
+
+
+broadcaster = Broadcaster()
+
+
+async def watch_shared_snapshot():
+    # Followers only learn about new snapshots on reads; poll while streaming
+    while True:
+        await asyncio.sleep(STREAM_POLL_INTERVAL)
+        if broadcaster.subscribers and refresh_lock_fd is None:
+            try:
+                sync_shared_snapshot()
+            except Exception as e:
+                logging.error(f"[STREAM SYNC ERROR] {e}")
+
+
+# --- In-memory rate snapshot ---
+PERSIST_INTERVAL = int(os.getenv("PERSIST_INTERVAL", "10"))
+
+
+# Immutable view of the latest rates; endpoints read it without touching disk.
+# Each entry is {"rate", "fetched_at", "stale"} and is replaced, never mutated.
+@dataclass(frozen=True)
+class RateSnapshot:
+    version: int
+    timestamp: float
+    rates: Mapping[str, dict]
+    # `"key":entry` JSON fragments, serialized once per version for /rates
+    encoded: Mapping[str, bytes]
+    # Cross rates for pairs a provider doesn't quote directly, kept apart from
+    # `rates` so they are never persisted or shared as if they were scraped
+    derived: Mapping[str, dict]
+    derived_encoded: Mapping[str, bytes]
+    # (from, to) -> serialized /compare body, providers ranked best-first
+    rankings: Mapping[tuple[str, str], bytes]
+
+
+snapshot: RateSnapshot | None = None
+snapshot_mtime: float | None = None
+persisted_version = 0
+
+
+def encode_entry(key: str, entry: dict) -> bytes:
+    return f"{json.dumps(key)}:{json.dumps(entry)}".encode()
+
+
+def install_snapshot(
+    version: int, timestamp: float, rates: dict, changed: set[str] | None = None
+) -> RateSnapshot:
+    global snapshot
+    previous = snapshot
+    if changed is not None and snapshot is not None:
+        encoded = dict(snapshot.encoded)
+        for key in changed:
+            encoded[key] = encode_entry(key, rates[key])
+        derived = dict(snapshot.derived)
+        derived_encoded = dict(snapshot.derived_encoded)
+        rankings = dict(snapshot.rankings)
+    else:
+        changed = set(rates)
+        encoded = {key: encode_entry(key, entry) for key, entry in rates.items()}
+        derived, derived_encoded, rankings = {}, {}, {}
+
+    for pair in {tuple(key.split("_")[1:]) for key in changed}:
+        body = rank_pair(rates, *pair)
+        if body is None:
+            rankings.pop(pair, None)
+        else:
+            rankings[pair] = body
+
+    # Only providers with changed entries get their cross rates recomputed
+    for provider in {key.split("_", 1)[0] for key in changed}:
+        prefix = f"{provider}_"
+        for key in [key for key in derived if key.startswith(prefix)]:
+            del derived[key]
+            del derived_encoded[key]
+        for key, entry in derive_cross_rates(provider, rates).items():
+            derived[key] = entry
+            derived_encoded[key] = encode_entry(key, entry)
+
+    snapshot = RateSnapshot(
+        version,
+        timestamp,
+        MappingProxyType(dict(rates)),
+        MappingProxyType(encoded),
+        MappingProxyType(derived),
+        MappingProxyType(derived_encoded),
+        MappingProxyType(rankings),
+    )
+    if broadcaster.subscribers:
+        if previous is not None and len(changed) == len(rates):
+            # Full reload (startup or follower sync): only push what moved
+            changed = {key for key in rates if previous.encoded.get(key) != encoded[key]}
+        broadcaster.publish(snapshot, changed)
+    return snapshot
+
+
+def next_version() -> int:
+    return snapshot.version + 1 if snapshot else 1
+
+
+def make_entry(previous: dict | None, rate, now: float) -> dict:
+    if rate is not None:
+        return {"rate": rate, "fetched_at": now, "stale": False}
+    # Failed scrape: keep serving the last good value, flagged stale
+    if previous and previous.get("rate") is not None:
+        return {**previous, "stale": True}
+    return {"rate": None, "fetched_at": None, "stale": True}
+
+
+def publish_entries(results: dict, fetched_at: float | None = None):
+    if not results:
+        return
+    now = time.time()
+    if fetched_at is None:
+        fetched_at = now
+    rates = dict(snapshot.rates) if snapshot else {}
+    changed = set()
+    for key, rate in results.items():
+        previous = rates.get(key)
+        if previous and (previous.get("fetched_at") or 0) > fetched_at:
+            # Older than what we already serve
+            continue
+        rates[key] = make_entry(previous, rate, fetched_at)
+        record_history(key, fetched_at, rate)
+        changed.add(key)
+    if not changed:
+        return
+    snap = install_snapshot(next_version(), now, rates, changed=changed)
+    if shared_snapshot is not None:
+        shared_snapshot.write(snapshot_payload(snap))
+
+
+def persist_snapshot(snap: RateSnapshot):
+    global snapshot_mtime, persisted_version
+    # --- Write to temp file first ---
+    new_cache = {
+        "version": snap.version,
+        "timestamp": snap.timestamp,
+        "rates": dict(snap.rates),
+    }
+    with open(TEMP_CACHE_FILE, "w") as f:
+        json.dump(new_cache, f)
+
+    # --- Atomically replace main cache file ---
+    os.replace(TEMP_CACHE_FILE, CACHE_FILE)
+    snapshot_mtime = os.stat(CACHE_FILE).st_mtime
+    persisted_version = snap.version
+
+
+async def flush_snapshot():
+    snap = snapshot
+    if snap is not None and snap.version != persisted_version:
+        await asyncio.to_thread(persist_snapshot, snap)
+        logging.info(f"[CACHE UPDATED] version={snap.version}")
+
+
+async def persist_loop():
+    # Batch disk writes: at most one atomic write per PERSIST_INTERVAL
+    while True:
+        await asyncio.sleep(PERSIST_INTERVAL)
+        try:
+            await flush_snapshot()
+            await flush_history()
+        except Exception as e:
+            logging.error(f"[CACHE WRITE ERROR] {e}")
+
+
+def read_cache_file() -> tuple[float, dict] | None:
+    # Returns (mtime, cache) when the file changed since we last saw it
+    try:
+        mtime = os.stat(CACHE_FILE).st_mtime
+    except FileNotFoundError:
+        return None
+    if mtime == snapshot_mtime:
+        return None
     with open(CACHE_FILE, "r") as f:
-        cache = json.load(f)
-    key = f"LEMFI_{from_currency.upper()}_{to_currency.upper()}"
-    return {"Lemfi": cache["rates"].get(key), "cached_at": cache["timestamp"]}
+        return mtime, json.load(f)
+
+
+TAPTAP_KEY = re.compile(r"TAPTAP_[A-Z]{3}_[A-Z]{3}")
+
+
+def known_rate_key(key: str) -> bool:
+    # Registry pairs, plus TapTap corridors (those come from the feed, not the registry)
+    return key in pair_breakers or TAPTAP_KEY.fullmatch(key) is not None
+
+
+def load_cache(loaded: tuple[float, dict] | None):
+    global snapshot_mtime, persisted_version
+    if loaded is None:
+        return
+    mtime, cache = loaded
+    snapshot_mtime = mtime
+    if snapshot is not None and cache.get("version", 0) <= snapshot.version:
+        # Our own write, or older than what we already serve
+        return
+    rates = {}
+    for key, entry in cache["rates"].items():
+        if not known_rate_key(key):
+            # e.g. the old file's unsupported provider/pair combinations, which
+            # would otherwise sit there stale forever
+            continue
+        if not isinstance(entry, dict):
+            # Cache files written before per-entry timestamps
+            entry = {"rate": entry, "fetched_at": cache["timestamp"], "stale": entry is None}
+        rates[key] = entry
+    version = cache.get("version", 0) or next_version()
+    install_snapshot(version, cache["timestamp"], rates)
+    persisted_version = version
+    logging.info(f"[CACHE RELOADED] version={version}")
+
+
+# --- Rate history ---
+# Every successful scrape is appended to HISTORY_DIR/<key>.bin as a fixed
+# 16-byte (fetched_at, rate) record. Records are in time order, so range
+# queries binary-search the mmapped file and only touch the requested slice.
+HISTORY_DIR = os.getenv("HISTORY_DIR", "history")
+HISTORY_RECORD = struct.Struct("<dd")
+HISTORY_MAX_BUCKETS = 2000
+pending_history: list[tuple[str, float, float]] = []
+
+
+def record_history(key: str, fetched_at: float, rate):
+    value = to_float(rate)
+    if value is not None:
+        pending_history.append((key, fetched_at, value))
+
+
+def history_path(key: str) -> str:
+    return os.path.join(HISTORY_DIR, f"{key}.bin")
+
+
+def write_history(records: list[tuple[str, float, float]]):
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    by_key: dict[str, list[bytes]] = {}
+    for key, fetched_at, value in records:
+        by_key.setdefault(key, []).append(HISTORY_RECORD.pack(fetched_at, value))
+    for key, packed in by_key.items():
+        with open(history_path(key), "ab") as f:
+            f.write(b"".join(packed))
 
 
-@app.get("/myeasytransfer")
-async def myeasytransfer(
-    from_currency: str = Query(...), to_currency: str = Query(...)
+async def flush_history():
+    global pending_history
+    if pending_history:
+        records, pending_history = pending_history, []
+        await asyncio.to_thread(write_history, records)
+
+
+def history_bisect(mm, count: int, timestamp: float) -> int:
+    # First record index with fetched_at >= timestamp
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if HISTORY_RECORD.unpack_from(mm, mid * HISTORY_RECORD.size)[0] < timestamp:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def query_history(key: str, start: float, end: float, buckets: int) -> list[dict]:
+    try:
+        f = open(history_path(key), "rb")
+    except FileNotFoundError:
+        return []
+    with f:
+        count = os.fstat(f.fileno()).st_size // HISTORY_RECORD.size
+        if count == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            lo = history_bisect(mm, count, start)
+            hi = history_bisect(mm, count, end)
+            width = (end - start) / buckets
+            points: dict[int, dict] = {}
+            view = memoryview(mm)[lo * HISTORY_RECORD.size : hi * HISTORY_RECORD.size]
+            try:
+                for fetched_at, value in HISTORY_RECORD.iter_unpack(view):
+                    index = min(int((fetched_at - start) / width), buckets - 1)
+                    point = points.get(index)
+                    if point is None:
+                        points[index] = {
+                            "t": start + index * width,
+                            "min": value,
+                            "max": value,
+                            "last": value,
+                            "count": 1,
+                        }
+                    else:
+                        point["min"] = min(point["min"], value)
+                        point["max"] = max(point["max"], value)
+                        point["last"] = value
+                        point["count"] += 1
+            finally:
+                view.release()
+    return [points[index] for index in sorted(points)]
+
+
+# --- Multi-worker coordination ---
+# With `uvicorn --workers N` only the worker holding REFRESH_LOCK_FILE scrapes
+# and writes. It publishes every snapshot into a shared memory-mapped file
+# guarded by a sequence counter (odd while a write is in progress); the other
+# workers compare that counter on each read and only re-parse when it moved.
+REFRESH_LOCK_FILE = os.getenv("REFRESH_LOCK_FILE", "fx_refresh.lock")
+SHARED_SNAPSHOT_FILE = os.getenv(
+    "SHARED_SNAPSHOT_FILE",
+    "/dev/shm/fx_rates.shm" if os.path.isdir("/dev/shm") else "fx_rates.shm",
+)
+SHARED_SNAPSHOT_SIZE = int(os.getenv("SHARED_SNAPSHOT_SIZE", str(4 * 1024 * 1024)))
+LEADER_RETRY_INTERVAL = int(os.getenv("LEADER_RETRY_INTERVAL", "5"))
+SHARED_HEADER = struct.Struct("<QQ")  # sequence, payload length
+
+
+class SharedSnapshot:
+    def __init__(self, path: str, size: int):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.size = size
+        self.seen = 0
+
+    def write(self, payload: bytes):
+        if SHARED_HEADER.size + len(payload) > self.size:
+            logging.error(f"[SHM] snapshot of {len(payload)} bytes exceeds SHARED_SNAPSHOT_SIZE")
+            return
+        seq, _ = SHARED_HEADER.unpack_from(self.mm, 0)
+        # An odd sequence left behind by a crashed writer is reused as-is
+        writing = seq + 1 if seq % 2 == 0 else seq
+        SHARED_HEADER.pack_into(self.mm, 0, writing, len(payload))
+        self.mm[SHARED_HEADER.size : SHARED_HEADER.size + len(payload)] = payload
+        SHARED_HEADER.pack_into(self.mm, 0, writing + 1, len(payload))
+        self.seen = writing + 1
+
+    def read(self) -> bytes | None:
+        # Returns the payload when it changed since the last read
+        for _ in range(100):
+            seq, length = SHARED_HEADER.unpack_from(self.mm, 0)
+            if seq == self.seen or seq == 0:
+                return None
+            if seq % 2:
+                continue
+            payload = self.mm[SHARED_HEADER.size : SHARED_HEADER.size + length]
+            if SHARED_HEADER.unpack_from(self.mm, 0)[0] == seq:
+                self.seen = seq
+                return payload
+        return None
+
+    def close(self):
+        self.mm.close()
+
+
+shared_snapshot: SharedSnapshot | None = None
+refresh_lock_fd: int | None = None
+
+
+def snapshot_payload(snap: RateSnapshot) -> bytes:
+    return b"".join(
+        [
+            f'{{"version":{snap.version},"timestamp":{json.dumps(snap.timestamp)},"rates":{{'.encode(),
+            b",".join(snap.encoded.values()),
+            b"}}",
+        ]
+    )
+
+
+def sync_shared_snapshot():
+    payload = shared_snapshot.read() if shared_snapshot is not None else None
+    if payload is None:
+        return
+    cache = json.loads(payload)
+    if snapshot is None or cache["version"] > snapshot.version:
+        install_snapshot(cache["version"], cache["timestamp"], cache["rates"])
+
+
+def current_snapshot() -> RateSnapshot | None:
+    if refresh_lock_fd is None:
+        sync_shared_snapshot()
+    return snapshot
+
+
+def try_acquire_refresh_lock() -> int | None:
+    fd = os.open(REFRESH_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+async def start_refresher():
+    global scrape_queue
+    # The browser pool starts on the first browser scrape, not here: HTTP and
+    # TapTap jobs shouldn't wait for Playwright to load
+    if snapshot is not None and shared_snapshot is not None:
+        shared_snapshot.write(snapshot_payload(snapshot))
+    if SCRAPE_MODE == "queue":
+        scrape_queue = ScrapeQueue(SCRAPE_QUEUE_FILE)
+        reset = scrape_queue.reset_leftovers(time.time())
+        if reset:
+            logging.info(f"[QUEUE] reset {reset} jobs left over by the previous leader")
+        background_tasks.append(asyncio.create_task(collect_queue_results()))
+        logging.info(f"[QUEUE] scrapes go through {SCRAPE_QUEUE_FILE}")
+    background_tasks.append(asyncio.create_task(persist_loop()))
+    background_tasks.append(asyncio.create_task(refresh()))
+
+
+async def elect_refresher():
+    # The OS drops the flock when its holder dies, so a follower takes over
+    global refresh_lock_fd
+    while refresh_lock_fd is None:
+        fd = try_acquire_refresh_lock()
+        if fd is not None:
+            sync_shared_snapshot()
+            refresh_lock_fd = fd
+            logging.info(f"[LEADER] worker {os.getpid()} is the refresher")
+            await start_refresher()
+            return
+        await asyncio.sleep(LEADER_RETRY_INTERVAL)
+
+
+def release_refresh_lock():
+    global refresh_lock_fd
+    if refresh_lock_fd is not None:
+        fcntl.flock(refresh_lock_fd, fcntl.LOCK_UN)
+        os.close(refresh_lock_fd)
+        refresh_lock_fd = None
+
+
+def rate_response(name: str, prefix: str, from_currency: str, to_currency: str) -> dict:
+    key = f"{prefix}_{from_currency.upper()}_{to_currency.upper()}"
+    record_read(key)
+    snap = current_snapshot()
+    if snap is None:
+        return {name: None, "error": "Cache not ready"}
+    entry = snap.rates.get(key)
+    if not entry or entry.get("rate") is None:
+        entry = snap.derived.get(key) or entry or {}
+    response = {
+        name: entry.get("rate"),
+        "cached_at": entry.get("fetched_at"),
+        "stale": entry.get("stale", False),
+    }
+    if entry.get("derived"):
+        response["derived"] = True
+        response["via"] = entry["via"]
+    return response
+
+
+# --- Endpoints that read cache ---
+def make_rate_endpoint(provider: Provider):
+    async def endpoint(from_currency: str = Query(...), to_currency: str = Query(...)):
+        return rate_response(provider.name, provider.key, from_currency, to_currency)
+
+    endpoint.__name__ = provider.route.strip("/")
+    return endpoint
+
+
+for _provider in PROVIDERS.values():
+    app.add_api_route(_provider.route, make_rate_endpoint(_provider), methods=["GET"])
+
+
+# --- Batch endpoint ---
+PROVIDER_PREFIXES = tuple(RATE_PROVIDERS)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+@app.get("/rates")
+async def rates(
+    request: Request,
+    pairs: str = Query(..., description="Comma-separated pairs, e.g. USD-MXN,EUR-TND"),
+    providers: str | None = Query(None, description="Comma-separated, e.g. MG,WU"),
 ):
-    if not os.path.exists(CACHE_FILE):
-        return {"MyEasyTransfer": None, "error": "Cache not ready"}
-    with open(CACHE_FILE, "r") as f:
-        cache = json.load(f)
-    key = f"MET_{from_currency.upper()}_{to_currency.upper()}"
-    return {"MyEasyTransfer": cache["rates"].get(key), "cached_at": cache["timestamp"]}
+    snap = current_snapshot()
+    if snap is None:
+        return {"rates": None, "error": "Cache not ready"}
+
+    wanted = (
+        [p.strip().upper() for p in providers.split(",") if p.strip()]
+        if providers
+        else PROVIDER_PREFIXES
+    )
+    keys = dict.fromkeys(
+        f"{provider}_{from_cur}_{to_cur}"
+        for from_cur, _, to_cur in (p.strip().upper().partition("-") for p in pairs.split(","))
+        for provider in wanted
+    )
+    for key in keys:
+        record_read(key)
+
+    etag = f'"{snap.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    fragments = [
+        snap.encoded.get(key) or snap.derived_encoded.get(key) or f"{json.dumps(key)}:null".encode()
+        for key in keys
+    ]
+    body = b"".join(
+        [
+            f'{{"version":{snap.version},"cached_at":{json.dumps(snap.timestamp)},"rates":{{'.encode(),
+            b",".join(fragments),
+            b"}}",
+        ]
+    )
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/compare")
+async def compare(from_currency: str = Query(...), to_currency: str = Query(...)):
+    pair = (from_currency.upper(), to_currency.upper())
+    for provider in PROVIDERS:
+        record_read(f"{provider}_{pair[0]}_{pair[1]}")
+    snap = current_snapshot()
+    if snap is None:
+        return {"rankings": None, "error": "Cache not ready"}
+    body = snap.rankings.get(pair)
+    if body is None:
+        return {"from": pair[0], "to": pair[1], "best": None, "rankings": []}
+    return Response(content=body, media_type="application/json")
+
+
+def parse_pairs(pairs: str | None) -> set[tuple[str, str]] | None:
+    if not pairs:
+        return None
+    return {
+        (from_cur, to_cur)
+        for from_cur, _, to_cur in (p.strip().upper().partition("-") for p in pairs.split(","))
+    }
+
+
+@app.get("/stream")
+async def stream(
+    pairs: str | None = Query(None, description="Comma-separated pairs, e.g. USD-MXN"),
+    providers: str | None = Query(None, description="Comma-separated, e.g. MG,WU"),
+):
+    subscriber = Subscriber(
+        parse_pairs(pairs),
+        {p.strip().upper() for p in providers.split(",") if p.strip()} if providers else None,
+    )
+
+    async def events():
+        broadcaster.subscribe(subscriber)
+        try:
+            snap = current_snapshot()
+            if snap is not None:
+                keys = [key for key in snap.encoded if subscriber.wants(key)]
+                if keys:
+                    yield rates_frame(snap, keys)
+            while True:
+                try:
+                    frame = await asyncio.wait_for(
+                        subscriber.queue.get(), timeout=STREAM_HEARTBEAT
+                    )
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+                    continue
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/history")
+async def history(
+    provider: str = Query(..., description="e.g. MG, WU, LEMFI, MET, TAPTAP"),
+    from_currency: str = Query(...),
+    to_currency: str = Query(...),
+    start: float | None = Query(None, description="Unix time, default 30 days ago"),
+    end: float | None = Query(None, description="Unix time, default now"),
+    buckets: int = Query(200, ge=1, le=HISTORY_MAX_BUCKETS),
+):
+    key = f"{provider.upper()}_{from_currency.upper()}_{to_currency.upper()}"
+    # The key becomes a file name under HISTORY_DIR, so only known keys get through
+    if not known_rate_key(key):
+        return {"points": [], "error": f"Unknown provider pair {key}"}
+    end = end if end is not None else time.time()
+    start = start if start is not None else end - 30 * 86400
+    if not (math.isfinite(start) and math.isfinite(end)):
+        return {"points": [], "error": "start and end must be finite"}
+    if start >= end:
+        return {"points": [], "error": "start must be before end"}
+    points = await asyncio.to_thread(query_history, key, start, end, buckets)
+    return {
+        "key": key,
+        "start": start,
+        "end": end,
+        "bucket_seconds": (end - start) / buckets,
+        "points": points,
+    }
+
+
+@app.get("/taptap")
+async def get_taptap_rate(
+    from_currency: str = Query(..., alias="from"),
+    to_currency: str = Query(..., alias="to"),
+):
+    snap = current_snapshot()
+    key = f"TAPTAP_{from_currency.upper()}_{to_currency.upper()}"
+    entry = snap.rates.get(key) if snap else None
+    # The refresher keeps these entries current; serving them at any age keeps
+    # workers from each calling TapTap between refreshes
+    if entry and entry.get("rate") is not None:
+        return {
+            "provider": "TapTap Send",
+            "rate": entry["rate"],
+            "cached_at": entry.get("fetched_at"),
+            "stale": entry.get("stale", False),
+        }
+    if snap and any(k.startswith("TAPTAP_") for k in snap.rates):
+        # TapTap has been scraped and doesn't offer this corridor
+        return {"provider": "TapTap Send", "rate": None}
+    # Cold start before the first TapTap refresh: fetch once (single-flight)
+    try:
+        index = await get_taptap_index()
+    except Exception as e:
+        return {"provider": "TapTap Send", "rate": None, "error": str(e)}
+    rate = index.get((from_currency.upper(), to_currency.upper()))
+    return {"provider": "TapTap Send", "rate": rate}
+
+
+# --- Metrics endpoint ---
+UNTIMED_PATHS = ("/stream", "/metrics")
+
+
+class ReadTimer:
+    # Plain ASGI middleware: BaseHTTPMiddleware (@app.middleware) wraps every
+    # response in a streaming task and costs a large share of read throughput
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in UNTIMED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                # The router stores the matched route in the shared scope; label by
+                # its template so unknown paths can't blow up cardinality
+                route = scope.get("route")
+                endpoint = route.path if route else "other"
+                read_duration.observe(time.perf_counter() - started, endpoint)
+
+        await self.app(scope, receive, timed_send)
+
+
+app.add_middleware(ReadTimer)
+
+
+def snapshot_metrics(snap: RateSnapshot | None, now: float) -> list[str]:
+    lines = [
+        "# HELP fx_snapshot_version Version of the snapshot this worker serves",
+        "# TYPE fx_snapshot_version gauge",
+        f"fx_snapshot_version {snap.version if snap else 0}",
+        "# HELP fx_rate_age_seconds Seconds since each entry was last scraped",
+        "# TYPE fx_rate_age_seconds gauge",
+    ]
+    if snap is None:
+        return lines
+    stale = []
+    for key, entry in sorted(snap.rates.items()):
+        if entry.get("fetched_at") is not None:
+            lines.append(f'fx_rate_age_seconds{{key="{key}"}} {now - entry["fetched_at"]:.0f}')
+        stale.append(f'fx_rate_stale{{key="{key}"}} {int(bool(entry.get("stale")))}')
+    lines += [
+        "# HELP fx_rate_stale 1 if the last scrape of the entry failed",
+        "# TYPE fx_rate_stale gauge",
+        *stale,
+    ]
+    return lines
+
+
+# Every process (web workers and scrape_worker.py on this host) dumps its
+# metric values to METRICS_DIR/<pid>.json every METRICS_PUBLISH_INTERVAL, and
+# /metrics on any worker merges all the dumps, so a scrape that lands on a
+# follower still sees the leader's scrape series. Series carry a worker label;
+# aggregate with `sum without (worker)`. A leader failover shows up as a new
+# worker series. Dumps not refreshed within METRICS_STALE_AFTER belong to
+# dead processes and are deleted.
+METRICS_DIR = os.getenv(
+    "METRICS_DIR", "/dev/shm/fx_metrics" if os.path.isdir("/dev/shm") else "fx_metrics"
+)
+METRICS_PUBLISH_INTERVAL = int(os.getenv("METRICS_PUBLISH_INTERVAL", "5"))
+METRICS_STALE_AFTER = 3 * METRICS_PUBLISH_INTERVAL
+
+
+def metrics_path(pid: int) -> str:
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def publish_metrics():
+    dump = {metric.name: [[list(k), v] for k, v in metric.values.items()] for metric in METRICS}
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = metrics_path(os.getpid())
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(dump, f)
+    os.replace(f"{path}.tmp", path)
+
+
+async def publish_metrics_loop():
+    while True:
+        try:
+            publish_metrics()
+        except OSError as e:
+            logging.warning(f"[METRICS] could not publish to {METRICS_DIR}: {e}")
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+
+
+def remove_metrics_dump():
+    with contextlib.suppress(OSError):
+        os.remove(metrics_path(os.getpid()))
+
+
+def worker_metric_values(now: float) -> dict[str, dict[str, dict]]:
+    # metric name -> pid -> values; this process is read live, the rest from their dumps
+    pid = str(os.getpid())
+    merged = {metric.name: {pid: metric.values} for metric in METRICS}
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return merged
+    for name in names:
+        worker, ext = os.path.splitext(name)
+        if ext != ".json" or worker == pid:
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            if now - os.stat(path).st_mtime > METRICS_STALE_AFTER:
+                os.remove(path)
+                continue
+            with open(path) as f:
+                dump = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric_name, series in dump.items():
+            if metric_name in merged:
+                merged[metric_name][worker] = {tuple(k): v for k, v in series}
+    return merged
+
+
+@app.get("/metrics")
+async def metrics():
+    now = time.time()
+    workers = worker_metric_values(now)
+    lines = []
+    for metric in METRICS:
+        lines += metric.render(workers[metric.name])
+    lines += snapshot_metrics(current_snapshot(), now)
+    return Response(
+        "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/health")
+async def health(response: Response):
+    # Readiness (a snapshot is loaded, so reads return data) is separate from
+    # freshness: a worker that booted from an old snapshot still takes traffic
+    snap = current_snapshot()
+    if snap is None:
+        response.status_code = 503
+        return {"ready": False, "refresher": refresh_lock_fd is not None}
+    now = time.time()
+    ages = [
+        now - entry["fetched_at"]
+        for entry in snap.rates.values()
+        if entry.get("fetched_at") is not None
+    ]
+    return {
+        "ready": True,
+        "refresher": refresh_lock_fd is not None,
+        "version": snap.version,
+        "snapshot_age": round(now - snap.timestamp),
+        "entries": len(snap.rates),
+        "fresh": sum(
+            1
+            for entry in snap.rates.values()
+            if not entry.get("stale") and entry.get("rate") is not None
+        ),
+        "stale": sum(1 for entry in snap.rates.values() if entry.get("stale")),
+        "oldest_age": round(max(ages)) if ages else None,
+        "newest_age": round(min(ages)) if ages else None,
+    }
 
 
 @app.get("/ping")
@@ -560,6 +2709,42 @@ def ping():
     return {"status": "ok"}
 
 
+background_tasks: list[asyncio.Task] = []
+
+
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(refresh())
+    global shared_snapshot, demand_counters
+    try:
+        load_cache(read_cache_file())
+    except Exception as e:
+        logging.error(f"[CACHE LOAD ERROR] {e}")
+    shared_snapshot = SharedSnapshot(SHARED_SNAPSHOT_FILE, SHARED_SNAPSHOT_SIZE)
+    sync_shared_snapshot()
+    demand_counters = DemandCounters(DEMAND_FILE, len(DEMAND_SLOTS))
+    background_tasks.append(asyncio.create_task(watch_shared_snapshot()))
+    background_tasks.append(asyncio.create_task(publish_metrics_loop()))
+    background_tasks.append(asyncio.create_task(elect_refresher()))
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in background_tasks:
+        task.cancel()
+    for task in background_tasks:
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    background_tasks.clear()
+    if refresh_lock_fd is not None:
+        await flush_snapshot()
+        await flush_history()
+        await close_http_client()
+        await browser_pool.close()
+        if scrape_queue is not None:
+            scrape_queue.close()
+        release_refresh_lock()
+    if shared_snapshot is not None:
+        shared_snapshot.close()
+    if demand_counters is not None:
+        demand_counters.close()
+    remove_metrics_dump()
@@ -0,0 +1,187 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import json
+import random
+import threading
+import time
+
+# Local stand-ins for the provider endpoints, used by selfcheck.py and
+# bench.py. Every response is derived from the request, so callers can compute
+# the rate they expect with stub_rate() without sharing state with the server.
+# Latency and failure rate can be set per provider to mimic slow or flaky
+# upstreams; a failed request gets a 503 text/plain answer, like a challenge.
+
+COUNTRY_CURRENCIES = {
+    "TUN": "TND",
+    "MAR": "MAD",
+    "MEX": "MXN",
+    "IND": "INR",
+    "COL": "COP",
+    "TUR": "TRY",
+}
+TAPTAP_CORRIDORS = {
+    "CAD": ["TND", "MAD", "INR", "MXN"],
+    "USD": ["TND", "MAD", "INR", "MXN", "COP"],
+    "EUR": ["TND", "MAD", "INR", "COP", "TRY"],
+}
+
+
+def stub_rate(*parts: str) -> float:
+    seed = sum(ord(c) * (i + 1) for i, c in enumerate("".join(parts)))
+    return round(1 + (seed % 99991) / 1000, 4)
+
+
+def lemfi_page(from_currency: str, to_currency: str) -> str:
+    # Same shape as the Nuxt page LEMFI_CONFIG's XPath points into:
+    # #__nuxt > div[2] > div[1] > div[2] > div[1] > div[1] > div[3] > div[1] > span[2]
+    rate = stub_rate(from_currency, to_currency)
+    return f"""<!doctype html>
+<html><head><link rel="stylesheet" href="/static/app.css"></head>
+<body><div id="__nuxt"></div>
+<script>
+setTimeout(() => {{
+  document.getElementById("__nuxt").innerHTML =
+    '<div></div><div><div><div></div><div><div><div><div></div><div></div><div>' +
+    '<div><span>Rate</span><span>1 {from_currency} = {rate:,.4f} {to_currency}</span></div>' +
+    '</div></div></div></div></div></div>';
+}}, 300);
+</script>
+<img src="/static/hero.jpg">
+</body></html>"""
+
+
+def wu_page(from_currency: str, to_currency: str) -> str:
+    # WU pages render the rate from an XHR: the catalog for USD/EUR senders,
+    # the router for everyone else
+    if from_currency in ("USD", "EUR"):
+        xhr = f"/wuconnect/prices/catalog?from={from_currency}&to={to_currency}"
+    else:
+        xhr = f"/router/?from={from_currency}&to={to_currency}"
+    return f"""<!doctype html>
+<html><head><link rel="stylesheet" href="/static/app.css"></head>
+<body><p>Send money</p>
+<script>fetch("{xhr}").then(r => r.json());</script>
+<img src="/static/hero.jpg">
+</body></html>"""
+
+
+def wu_router(from_currency: str, to_currency: str) -> dict:
+    products = [{"strikeExchangeRate": None} for _ in range(7)]
+    products.append({"strikeExchangeRate": stub_rate(from_currency, to_currency)})
+    return {"data": {"products": {"products": products}}}
+
+
+def wu_catalog(from_currency: str, to_currency: str) -> dict:
+    rate = stub_rate(from_currency, to_currency)
+    if from_currency == "EUR":
+        return {"services_groups": [{}, {"pay_groups": [{"strike_fx_rate": rate}]}]}
+    return {"categories": [{"services": [{"strike_fx_rate": rate}]}]}
+
+
+def moneygram_quote(params: dict) -> dict:
+    to_currency = COUNTRY_CURRENCIES.get(params.get("receiverCountryCode", ""), "")
+    rate = stub_rate(params.get("senderCurrencyCode", ""), to_currency)
+    return {"feeQuotesByCurrency": {to_currency: {"fxRate": rate}}}
+
+
+def myeasytransfer_rate(params: dict) -> dict:
+    rate = stub_rate(
+        params.get("departureCurrencyId", ""), params.get("destinationCurrencyId", "")
+    )
+    return {"fxRate": {"fxRateBank": rate}}
+
+
+def taptap_rates() -> dict:
+    return {
+        "availableCountries": [
+            {
+                "currency": source,
+                "corridors": [
+                    {"currency": target, "fxRate": str(stub_rate(source, target))}
+                    for target in targets
+                ],
+            }
+            for source, targets in TAPTAP_CORRIDORS.items()
+        ]
+    }
+
+
+def path_provider(path: str) -> str | None:
+    if path.startswith("/api/send-money/"):
+        return "MG"
+    if path.startswith("/v1/fxrates/"):
+        return "MET"
+    if path.startswith("/api/fxRates"):
+        return "TAPTAP"
+    if path.startswith(("/wu/", "/router/", "/wuconnect/")):
+        return "WU"
+    if path.startswith("/lemfi/"):
+        return "LEMFI"
+    return None
+
+
+class ProviderStubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data: dict):
+        self.send_body(json.dumps(data).encode(), "application/json")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        path = url.path
+
+        provider = path_provider(path)
+        with self.server.lock:
+            self.server.requests[provider] = self.server.requests.get(provider, 0) + 1
+        latency = self.server.latency.get(provider, 0)
+        if latency:
+            time.sleep(latency)
+        if random.random() < self.server.failure_rate.get(provider, 0):
+            self.send_body(b"stub failure", "text/plain", status=503)
+            return
+
+        if path == "/api/send-money/fee-quote/v2":
+            self.send_json(moneygram_quote(params))
+        elif path == "/v1/fxrates/fxrate":
+            self.send_json(myeasytransfer_rate(params))
+        elif path == "/api/fxRates":
+            self.send_json(taptap_rates())
+        elif path == "/router/":
+            self.send_json(wu_router(params["from"], params["to"]))
+        elif path == "/wuconnect/prices/catalog":
+            self.send_json(wu_catalog(params["from"], params["to"]))
+        elif path.startswith("/wu/") and path.endswith(".html"):
+            from_currency, to_currency = path[len("/wu/") : -len(".html")].split("-")
+            self.send_body(wu_page(from_currency, to_currency).encode(), "text/html")
+        elif path.startswith("/lemfi/"):
+            from_currency, to_currency = path[len("/lemfi/") :].split("-")
+            self.send_body(lemfi_page(from_currency, to_currency).encode(), "text/html")
+        elif path.startswith("/static/"):
+            self.send_body(b"\0" * 50_000, "application/octet-stream")
+        else:
+            self.send_body(b"not found", "text/plain", status=404)
+
+
+def start_stub_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: dict[str, float] | None = None,
+    failure_rate: dict[str, float] | None = None,
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), ProviderStubHandler)
+    server.daemon_threads = True
+    server.latency = latency or {}
+    server.failure_rate = failure_rate or {}
+    server.requests = {}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,30 @@
+import argparse
+import asyncio
+import contextlib
+
+import main
+
+# Scrape worker for SCRAPE_MODE=queue. Leases (provider, pair) jobs from the
+# shared SCRAPE_QUEUE_FILE, scrapes them with the usual browser pool / HTTP
+# client and reports the result for the leader to publish. Run as many as the
+# host (or hosts sharing the queue) can take:
+#
+#   SCRAPE_QUEUE_FILE=/data/scrape_queue.db python scrape_worker.py --providers WU,LEMFI
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape queue worker")
+    parser.add_argument("--providers", default="", help="comma-separated provider keys (default: all)")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=main.REFRESH_MAX_CONCURRENCY,
+        help="jobs leased at once",
+    )
+    args = parser.parse_args()
+
+    providers = tuple(p.strip().upper() for p in args.providers.split(",") if p.strip())
+    unknown = [p for p in providers if p not in main.PROVIDERS]
+    if unknown:
+        parser.error(f"unknown providers: {', '.join(unknown)}")
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(main.scrape_worker(providers, args.concurrency))
@@ -0,0 +1,119 @@
+import asyncio
+import dataclasses
+import logging
+import sys
+import time
+from urllib.parse import urlencode, urlparse
+
+import main
+from provider_stubs import COUNTRY_CURRENCIES, start_stub_server, stub_rate
+
+# Runs every extraction path (JSON over HTTP, JSON from <pre> in the browser,
+# intercepted WU XHRs, the Lemfi selector and the TapTap index) against local
+# fixture pages, using the same browser pool, headless/stealth settings and
+# extractors as production:
+#
+#   python selfcheck.py
+#
+# Exits non-zero if any extraction fails, so it can gate a headless image.
+
+PAIRS = {
+    "MG": [("USD", "MXN"), ("CAD", "TND"), ("EUR", "INR")],
+    "WU": [("USD", "MXN"), ("EUR", "TND"), ("CAD", "MAD")],
+    "LEMFI": [("CAD", "TND"), ("EUR", "INR")],
+    "MET": [("EUR", "TND")],
+}
+
+
+def fixture_providers(base: str, pairs_by_provider=PAIRS) -> dict[str, main.Provider]:
+    providers = {}
+    for key, pairs in pairs_by_provider.items():
+        provider = main.PROVIDERS[key]
+        specs = {}
+        for pair in pairs:
+            spec = provider.pairs[pair]
+            if spec.method == "json":
+                url = base + urlparse(spec.url).path
+                specs[pair] = dataclasses.replace(spec, url=url)
+            elif spec.method == "intercept":
+                specs[pair] = dataclasses.replace(
+                    spec,
+                    url=f"{base}/wu/{pair[0]}-{pair[1]}.html",
+                    intercepts=main.wu_intercepts(
+                        pair[0], f"{base}/router/", f"{base}/wuconnect/prices/catalog"
+                    ),
+                )
+            else:
+                url = f"{base}/lemfi/{pair[0]}-{pair[1]}"
+                specs[pair] = dataclasses.replace(spec, url=url)
+        # Never overwrite the real MoneyGram session with fixture cookies
+        providers[key] = dataclasses.replace(provider, pairs=specs, session_file=None)
+    return providers
+
+
+def expected_rate(key: str, spec: main.PairSpec, pair: tuple[str, str]) -> float:
+    if key == "MG":
+        to_currency = COUNTRY_CURRENCIES[spec.params["receiverCountryCode"]]
+        return stub_rate(spec.params["senderCurrencyCode"], to_currency)
+    if key == "MET":
+        params = spec.params
+        return stub_rate(params["departureCurrencyId"], params["destinationCurrencyId"])
+    return stub_rate(*pair)
+
+
+def report(ok: bool, label: str, got, want, started: float) -> bool:
+    status = "PASS" if ok else "FAIL"
+    print(f"{status} {label}: got {got!r}, want {want} ({time.monotonic() - started:.2f}s)")
+    return ok
+
+
+async def check(base: str) -> bool:
+    ok = True
+    for key, provider in fixture_providers(base).items():
+        for pair, spec in provider.pairs.items():
+            want = expected_rate(key, spec, pair)
+            label = f"{key} {pair[0]}->{pair[1]} [{spec.method}, headless={provider.headless}]"
+            started = time.monotonic()
+            try:
+                got = await main.FETCH_METHODS[spec.method](provider, spec, *pair)
+            except Exception as e:
+                got = e
+            ok &= report(main.to_float(got) == want, label, got, want, started)
+
+            if spec.method == "json":
+                # Also prove the browser fallback can read the same JSON
+                started = time.monotonic()
+                try:
+                    url = f"{spec.url}?{urlencode(spec.params)}"
+                    got = spec.extractor(await main.fetch_json_browser(provider, url, *pair))
+                except Exception as e:
+                    got = e
+                ok &= report(
+                    main.to_float(got) == want, f"{label} browser fallback", got, want, started
+                )
+
+    main.TAPTAP_URL = f"{base}/api/fxRates"
+    want = stub_rate("USD", "MXN")
+    started = time.monotonic()
+    try:
+        got = (await main.fetch_taptap_index()).get(("USD", "MXN"))
+    except Exception as e:
+        got = e
+    ok &= report(got == want, "TAPTAP USD->MXN", got, want, started)
+    return ok
+
+
+async def run() -> bool:
+    server = start_stub_server()
+    base = f"http://127.0.0.1:{server.server_port}"
+    try:
+        return await check(base)
+    finally:
+        await main.close_http_client()
+        await main.browser_pool.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    sys.exit(0 if asyncio.run(run()) else 1)
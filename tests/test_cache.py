@@ -0,0 +1,22 @@
+import main
+
+
+def test_load_cache_drops_keys_outside_the_registry(monkeypatch):
+    monkeypatch.setattr(main, "snapshot", None)
+    monkeypatch.setattr(main, "snapshot_mtime", None)
+    monkeypatch.setattr(main, "persisted_version", 0)
+    # Shape of the original cache file: bare rates, every provider x every MG pair
+    cache = {
+        "timestamp": 1000.0,
+        "rates": {
+            "MG_USD_MXN": 17.5,
+            "LEMFI_CAD_MXN": None,
+            "MET_CAD_TND": None,
+            "TAPTAP_USD_MXN": "18.1",
+            "TAPTAP_../x": 1.0,
+        },
+    }
+    main.load_cache((1.0, cache))
+
+    assert set(main.snapshot.rates) == {"MG_USD_MXN", "TAPTAP_USD_MXN"}
+    assert main.snapshot.rates["MG_USD_MXN"] == {"rate": 17.5, "fetched_at": 1000.0, "stale": False}
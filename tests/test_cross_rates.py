@@ -0,0 +1,43 @@
+import main
+
+
+def filled_rates(provider: str) -> dict:
+    return {
+        f"{provider}_{from_cur}_{to_cur}": {
+            "rate": 1 + (len(from_cur + to_cur) + ord(to_cur[0])) / 100,
+            "fetched_at": 1000.0,
+            "stale": False,
+        }
+        for from_cur, to_cur in main.PROVIDERS[provider].pairs
+    }
+
+
+def test_derives_new_sender_to_receiver_corridor():
+    rates = filled_rates("LEMFI")
+    derived = main.derive_cross_rates("LEMFI", rates)
+
+    # Lemfi quotes USD only to INR; USD->TND needs a walked-back middle leg
+    entry = derived["LEMFI_USD_TND"]
+    via = entry["via"]
+    assert entry["derived"] is True
+    assert len(via) == 4 and via[0] == "USD" and via[1] == "INR" and via[-1] == "TND"
+    middle = via[2]
+    want = (
+        rates["LEMFI_USD_INR"]["rate"]
+        / rates[f"LEMFI_{middle}_INR"]["rate"]
+        * rates[f"LEMFI_{middle}_TND"]["rate"]
+    )
+    assert entry["rate"] == round(want, 6)
+
+
+def test_only_senders_and_real_final_legs():
+    for provider in ("MG", "LEMFI", "MET"):
+        rates = filled_rates(provider)
+        senders = {key.split("_")[1] for key in rates}
+        receivers = {key.split("_")[2] for key in rates}
+        for key in main.derive_cross_rates(provider, rates):
+            _, source, target = key.split("_")
+            assert source in senders and target in receivers
+            assert key not in rates
+    # MG quotes every sender->receiver pair, so there is nothing to derive
+    assert main.derive_cross_rates("MG", filled_rates("MG")) == {}
@@ -0,0 +1,37 @@
+import asyncio
+
+import httpx
+
+import main
+
+
+def get(path):
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path)
+
+    return asyncio.run(run())
+
+
+def test_history_rejects_unknown_keys(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "HISTORY_DIR", str(tmp_path / "history"))
+    response = get("/history?provider=../../X&from_currency=USD&to_currency=MXN")
+    assert response.status_code == 200
+    assert response.json()["points"] == []
+    assert "Unknown" in response.json()["error"]
+
+
+def test_history_rejects_non_finite_bounds(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "HISTORY_DIR", str(tmp_path / "history"))
+    for bound in ("start=nan", "start=-inf", "end=inf"):
+        response = get(f"/history?provider=MG&from_currency=USD&to_currency=MXN&{bound}")
+        assert response.status_code == 200
+        assert response.json()["error"] == "start and end must be finite"
+
+
+def test_history_round_trip(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "HISTORY_DIR", str(tmp_path / "history"))
+    main.write_history([("MG_USD_MXN", 100.0, 17.0), ("MG_USD_MXN", 200.0, 18.0)])
+    body = get("/history?provider=mg&from_currency=usd&to_currency=mxn&start=0&end=300&buckets=3").json()
+    assert [(p["min"], p["max"], p["count"]) for p in body["points"]] == [(17.0, 17.0, 1), (18.0, 18.0, 1)]
@@ -0,0 +1,47 @@
+import asyncio
+from urllib.parse import parse_qs, urlparse
+
+import main
+from provider_stubs import moneygram_quote, start_stub_server, stub_rate
+from selfcheck import fixture_providers
+
+
+def fetch_mg(monkeypatch, failure_rate: float):
+    server = start_stub_server(failure_rate={"MG": failure_rate})
+    base = f"http://127.0.0.1:{server.server_port}"
+    provider = fixture_providers(base, {"MG": [("USD", "MXN")]})["MG"]
+    spec = provider.pairs[("USD", "MXN")]
+    browser_urls = []
+
+    # Stands in for Chromium: answers like the real <pre> extraction would
+    async def fake_browser(provider, url, from_currency, to_currency):
+        browser_urls.append(url)
+        params = {key: values[0] for key, values in parse_qs(urlparse(url).query).items()}
+        return moneygram_quote(params)
+
+    monkeypatch.setattr(main, "fetch_json_browser", fake_browser)
+
+    async def run():
+        try:
+            return await main.fetch_json_rate(provider, spec, "USD", "MXN")
+        finally:
+            await main.close_http_client()
+
+    try:
+        return asyncio.run(run()), browser_urls
+    finally:
+        server.shutdown()
+
+
+def test_json_rate_served_over_http(monkeypatch):
+    rate, browser_urls = fetch_mg(monkeypatch, failure_rate=0)
+    assert rate == stub_rate("USD", "MXN")
+    assert browser_urls == []
+
+
+def test_bot_challenge_falls_back_to_browser(monkeypatch):
+    # The stub answers 503 text/plain, like a challenge page
+    rate, browser_urls = fetch_mg(monkeypatch, failure_rate=1)
+    assert rate == stub_rate("USD", "MXN")
+    assert len(browser_urls) == 1
+    assert "senderCurrencyCode=USD" in browser_urls[0]
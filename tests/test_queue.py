@@ -0,0 +1,133 @@
+import asyncio
+import contextlib
+import sqlite3
+import time
+
+import main
+from provider_stubs import start_stub_server, stub_rate
+from selfcheck import fixture_providers
+
+
+def test_lease_report_retry_and_collect(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "QUEUE_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(main, "QUEUE_RETRY_BACKOFF", 0)
+    queue = main.ScrapeQueue(str(tmp_path / "queue.db"))
+    assert queue.enqueue("MG", "USD", "MXN")
+    assert not queue.enqueue("MG", "USD", "MXN")
+
+    key, *_ = queue.lease("w1")
+    assert queue.lease("w2") is None
+    # A failed attempt goes back to the queue until attempts run out
+    assert queue.report(key, "w1", None, "timeout", 1.0)
+    assert queue.lease("w2")[0] == key
+    assert not queue.report(key, "w1", 1.0, "success", 1.0)
+    before = time.time()
+    assert queue.report(key, "w2", None, "failure", 1.0)
+
+    [(*result, finished_at)] = queue.collect()
+    assert result == ["MG", "USD", "MXN", None, "failure", 1.0]
+    assert before <= finished_at <= time.time()
+    assert queue.enqueue("MG", "USD", "MXN")
+    queue.close()
+
+
+def test_new_leader_resets_leftovers(tmp_path):
+    queue = main.ScrapeQueue(str(tmp_path / "queue.db"))
+    for to_cur in ("MXN", "INR", "TND", "PHP"):
+        queue.enqueue("MG", "USD", to_cur)
+    for _ in range(3):
+        key, *_ = queue.lease("w1")
+        queue.report(key, "w1", 1.0, "success", 1.0)
+    # Two results finished long ago, one just now; the queued job is old too
+    old = time.time() - main.QUEUE_LEASE_SECONDS - 1
+    queue.db.execute("UPDATE jobs SET finished_at = ? WHERE key IN ('MG_USD_MXN', 'MG_USD_INR')", (old,))
+    queue.db.execute("UPDATE jobs SET available_at = ? WHERE state = 'queued'", (old,))
+
+    assert queue.reset_leftovers(time.time()) == 3
+    assert [r[:3] for r in queue.collect()] == [("MG", "USD", "TND")]
+    assert queue.enqueue("MG", "USD", "MXN")
+    assert queue.enqueue("MG", "USD", "PHP")
+    queue.close()
+
+
+def test_queue_file_without_finished_at_is_migrated(tmp_path):
+    path = str(tmp_path / "queue.db")
+    db = sqlite3.connect(path)
+    db.executescript(main.QUEUE_SCHEMA.replace(",\n    finished_at REAL", ""))
+    db.execute(
+        "INSERT INTO jobs (key, provider, from_cur, to_cur, state, available_at, result) "
+        "VALUES ('MG_USD_MXN', 'MG', 'USD', 'MXN', 'done', 0, 'success')"
+    )
+    db.commit()
+    db.close()
+
+    queue = main.ScrapeQueue(path)
+    # A result without a completion time can't be dated, so it isn't published
+    assert queue.reset_leftovers(time.time()) == 1
+    assert queue.collect() == []
+    queue.close()
+
+
+def test_queue_result_published_with_completion_time(monkeypatch):
+    monkeypatch.setattr(main, "snapshot", None)
+    monkeypatch.setattr(main, "pending_history", [])
+    finished_at = time.time() - 30
+    main.publish_entries({"MG_USD_MXN": "17.5"}, finished_at)
+    assert main.snapshot.rates["MG_USD_MXN"]["fetched_at"] == finished_at
+    assert main.pending_history == [("MG_USD_MXN", finished_at, 17.5)]
+
+    # A result older than the entry already served is dropped
+    main.publish_entries({"MG_USD_MXN": "17.1"}, finished_at - 60)
+    assert main.snapshot.rates["MG_USD_MXN"]["rate"] == "17.5"
+
+
+def test_expired_lease_is_handed_out_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "QUEUE_LEASE_SECONDS", -1)
+    queue = main.ScrapeQueue(str(tmp_path / "queue.db"))
+    queue.enqueue("WU", "USD", "MXN")
+    assert queue.lease("dead")[0] == "WU_USD_MXN"
+    assert queue.lease("alive")[0] == "WU_USD_MXN"
+    assert not queue.report("WU_USD_MXN", "dead", 1.0, "success", 1.0)
+    queue.close()
+
+
+def test_worker_scrapes_queued_jobs(tmp_path, monkeypatch):
+    server = start_stub_server()
+    base = f"http://127.0.0.1:{server.server_port}"
+    pairs = {"MG": [("USD", "MXN"), ("CAD", "TND")], "MET": [("EUR", "TND")]}
+    for key, provider in fixture_providers(base, pairs).items():
+        monkeypatch.setitem(main.PROVIDERS, key, provider)
+    monkeypatch.setattr(main, "SCRAPE_QUEUE_FILE", str(tmp_path / "queue.db"))
+    monkeypatch.setattr(main, "QUEUE_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(main, "METRICS_DIR", str(tmp_path / "metrics"))
+
+    producer = main.ScrapeQueue(main.SCRAPE_QUEUE_FILE)
+    for key, jobs in pairs.items():
+        for pair in jobs:
+            producer.enqueue(key, *pair)
+
+    async def run():
+        worker = asyncio.create_task(main.scrape_worker(("MG", "MET")))
+        results = []
+        for _ in range(100):
+            results += producer.collect()
+            if len(results) == 3:
+                break
+            await asyncio.sleep(0.05)
+        worker.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await worker
+        return results
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        producer.close()
+        server.shutdown()
+    assert sorted((r[0], r[1], r[2], r[4]) for r in results) == [
+        ("MET", "EUR", "TND", "success"),
+        ("MG", "CAD", "TND", "success"),
+        ("MG", "USD", "MXN", "success"),
+    ]
+    rates = {(r[1], r[2]): r[3] for r in results if r[0] == "MG"}
+    assert rates[("USD", "MXN")] == stub_rate("USD", "MXN")
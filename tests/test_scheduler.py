@@ -0,0 +1,14 @@
+import main
+
+
+def test_retry_delay_waits_for_open_breaker(monkeypatch):
+    key = main.SCRAPE_KEYS[0]
+    job = tuple(key.split("_"))
+    assert main.retry_delay(job) == main.REFRESH_RETRY_DELAY
+
+    breaker = main.CircuitBreaker(key)
+    for _ in range(main.BREAKER_FAILURE_THRESHOLD):
+        breaker.record_failure()
+    monkeypatch.setitem(main.pair_breakers, key, breaker)
+    monkeypatch.setattr(main, "REFRESH_RETRY_DELAY", 1)
+    assert main.retry_delay(job) > 1
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+import main
+
+
+def test_app_imports_with_routes():
+    paths = {route.path for route in main.app.routes}
+    for path in ("/rates", "/compare", "/stream", "/history", "/metrics", "/health", "/ping"):
+        assert path in paths
+    for provider in main.PROVIDERS.values():
+        assert provider.route in paths
+
+
+def test_ping():
+    async def get():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/ping")
+
+    response = asyncio.run(get())
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+
+def test_metrics_times_reads(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "METRICS_DIR", str(tmp_path))
+
+    async def get():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/ping")
+            return await client.get("/metrics")
+
+    response = asyncio.run(get())
+    assert response.status_code == 200
+    worker = os.getpid()
+    assert f'fx_read_duration_seconds_count{{worker="{worker}",endpoint="/ping"}}' in response.text
+    assert "# TYPE fx_blocked_bytes_estimated_total counter" in response.text
+
+
+def test_metrics_merge_other_workers(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "METRICS_DIR", str(tmp_path))
+    # A live leader's dump is served by every worker; a dead worker's is dropped
+    leader = {
+        "fx_scrapes_total": [[["MG", "success"], 3]],
+        "fx_blocked_bytes_estimated_total": [[["WU"], 120000]],
+    }
+    (tmp_path / "4242.json").write_text(json.dumps(leader))
+    dead = tmp_path / "4343.json"
+    dead.write_text(json.dumps({"fx_scrapes_total": [[["WU", "failure"], 1]]}))
+    stale = time.time() - main.METRICS_STALE_AFTER - 1
+    os.utime(dead, (stale, stale))
+
+    async def get():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/metrics")
+
+    text = asyncio.run(get()).text
+    assert 'fx_scrapes_total{worker="4242",provider="MG",result="success"} 3' in text
+    assert 'fx_blocked_bytes_estimated_total{worker="4242",provider="WU"} 120000' in text
+    assert 'worker="4343"' not in text
+    assert not dead.exists()
+
+    main.publish_metrics()
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+def test_health_not_ready_without_snapshot(monkeypatch):
+    monkeypatch.setattr(main, "snapshot", None)
+
+    async def get():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/health")
+
+    response = asyncio.run(get())
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
@@ -0,0 +1,31 @@
+import asyncio
+
+import httpx
+
+import main
+
+
+def get(path):
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path)
+
+    return asyncio.run(run())
+
+
+def test_taptap_serves_shared_entry_at_any_age(monkeypatch):
+    async def no_fetch(*args, **kwargs):
+        raise AssertionError("worker fetched TapTap itself")
+
+    monkeypatch.setattr(main, "snapshot", None)
+    monkeypatch.setattr(main, "get_taptap_index", no_fetch)
+    old = main.time.time() - 10 * main.TAPTAP_TTL
+    main.install_snapshot(
+        1, old, {"TAPTAP_USD_MXN": {"rate": 18.1, "fetched_at": old, "stale": True}}
+    )
+
+    body = get("/taptap?from=usd&to=mxn").json()
+    assert body["rate"] == 18.1
+    assert body["stale"] is True
+    assert get("/taptap?from=USD&to=XYZ").json()["rate"] is None